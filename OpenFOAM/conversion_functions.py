@@ -0,0 +1,733 @@
+import numpy as np
+import json
+import zlib
+import gzip
+import re
+import hashlib
+import multiprocessing as mp
+import time
+import os
+#
+# Binary File convert function
+#
+def save_to_binary(filename, array,my_datatype=np.float64):
+    '''
+        This function writes the array as a headerless binary file. The data is written to a
+        temporary file first so that an interrupted job never leaves a complete-looking file behind
+    INPUT
+        filename:       [string] Name of the output file
+        array:          [numpy array] Data to write
+        my_datatype:    [numpy dtype] Data type on disk
+    OUTPUT
+        None
+    '''
+    temporary_filename = filename+'.part'
+    with open(temporary_filename, 'wb') as f:
+        array.astype(my_datatype).tofile(f)
+    os.replace(temporary_filename, filename)
+#
+# Compressed File convert function
+#
+def save_to_compressed(filename, array, my_datatype=np.float32, compression='zlib', tolerance=None):
+    '''
+        This function writes the array as a compressed binary file (decoded by `functions.decode_plane`)
+    INPUT
+        filename:       [string] Name of the output file
+        array:          [numpy array] Data to write
+        my_datatype:    [numpy dtype] Data type of the values before compression
+        compression:    [string] 'zlib' (lossless for `my_datatype`) or 'quantize' (values rounded to
+                        integer multiples of 2*tolerance, absolute error <= tolerance, then zlib)
+        tolerance:      [float] Maximum absolute error for the 'quantize' compression, raises a ValueError
+                        if a value is not finite or exceeds the 32-bit integer range
+    OUTPUT
+        None
+    '''
+    if compression == 'zlib':
+        raw = array.astype(my_datatype).tobytes()
+    elif compression == 'quantize':
+        quantized = np.round(array/(2.0*tolerance))
+        limit = np.iinfo(np.int32).max
+        if not np.all(np.isfinite(quantized)) or np.any(np.abs(quantized) > limit):
+            raise ValueError(f"{filename}: values do not fit the 32-bit quantisation with tolerance {tolerance} "
+                             f"(|value| <= {limit*2.0*tolerance:g} and finite), increase the tolerance or use 'zlib'")
+        raw = quantized.astype(np.int32).tobytes()
+    else:
+        raise ValueError(f"Unknown compression `{compression}` | Valid compression: zlib or quantize")
+    temporary_filename = filename+'.part'
+    with open(temporary_filename, 'wb') as f:
+        f.write(zlib.compress(raw, 6))
+    os.replace(temporary_filename, filename)
+#
+# Read the point data from a VTK file
+#
+def read_vtk_pointdata(filename):
+    '''
+        This function reads the coordinates and the first point data array of a VTK polydata file
+    INPUT
+        filename:       [string] Name and location of the VTK file
+    OUTPUT
+        coordinates:    [numpy array] (points x 3) coordinates
+        data:           [numpy array] Point data, (points) for scalars or (points x 3) for vectors
+    '''
+    # Imported here so that the workers only pay for vtk when they read VTK files
+    from vtk.util.numpy_support import vtk_to_numpy
+    from vtk import vtkPolyDataReader
+    reader = vtkPolyDataReader()
+    reader.SetFileName(filename)
+    reader.Update()
+    polydata = reader.GetOutput()
+    coordinates = vtk_to_numpy(polydata.GetPoints().GetData())
+    data = vtk_to_numpy(polydata.GetPointData().GetArray(0))
+    return coordinates, data
+#
+# Parse a block of ASCII numbers
+#
+def parse_ascii_block(block, chunk_size=64*1024*1024):
+    '''
+        This function parses whitespace separated numbers, ignoring the brackets of OpenFOAM vector
+        entries, in chunks of about `chunk_size` bytes so that the temporary memory stays bounded
+    INPUT
+        block:          [bytes] ASCII numbers, e.g. '(1 2 3)\n(4 5 6)'
+        chunk_size:     [integer] Number of bytes parsed at once
+    OUTPUT
+        values:         [numpy array] Flat array of the parsed numbers
+    '''
+    brackets_to_spaces = bytes.maketrans(b'()', b'  ')
+    values = []
+    start = 0
+    while start < len(block):
+        stop = min(start+chunk_size, len(block))
+        if stop < len(block):
+            # Do not split a number, continue up to the next line break
+            newline = block.find(b'\n', stop)
+            stop = len(block) if newline < 0 else newline+1
+        chunk = block[start:stop].translate(brackets_to_spaces)
+        if chunk.strip():
+            values.append(np.fromstring(chunk, sep=' '))
+        start = stop
+    return np.concatenate(values) if values else np.zeros(0)
+#
+# Read an OpenFOAM field file
+#
+def read_foam_field(filename, npoints=None, chunk_size=64*1024*1024):
+    '''
+        This function reads the internalField of an OpenFOAM volScalarField or volVectorField
+        (ascii or binary format, optionally gzipped) without going through VTK. Only the header is
+        searched as text, the list is read in chunks of about `chunk_size` bytes (ascii) or in one
+        read of its exact size (binary), so the whole file is never held in memory
+    INPUT
+        filename:       [string] Name and location of the field file, e.g. '1200/U' or '1200/C'
+        npoints:        [integer] Number of cells, only needed for `uniform` fields
+        chunk_size:     [integer] Number of bytes of an ascii list parsed at once
+    OUTPUT
+        data:           [numpy array] (cells) for scalars or (cells x 3) for vectors
+    '''
+    internal_field = re.compile(rb'internalField\s+(uniform|nonuniform)\s*')
+    list_start = re.compile(rb'List<(\w+)>\s*(\d+)\s*\(')
+    list_end = re.compile(rb'\)\s*;')
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rb') as f:
+        # Read up to the start of the internalField values
+        content = b''
+        while True:
+            block = f.read(1024*1024)
+            content += block
+            match = internal_field.search(content)
+            if match is not None and (b';' in content[match.end():] if match.group(1) == b'uniform'
+                                      else list_start.match(content, match.end()) is not None):
+                break
+            if not block:
+                raise ValueError(f"{filename} has no internalField")
+        # Header information
+        header = re.search(rb'FoamFile\s*\{(.*?)\}', content, re.S)
+        header = header.group(1) if header else b''
+        file_format = re.search(rb'format\s+(\w+)\s*;', header)
+        is_binary = file_format is not None and file_format.group(1) == b'binary'
+        scalar_size = re.search(rb'scalar=(\d+)', header)
+        scalar_dtype = np.float32 if scalar_size and scalar_size.group(1) == b'32' else np.float64
+        field_class = re.search(rb'class\s+(\w+)\s*;', header)
+        ncomponents = 3 if field_class and b'Vector' in field_class.group(1) else 1
+        # Internal field
+        position = match.end()
+        if match.group(1) == b'uniform':
+            value_end = content.index(b';', position)
+            value = parse_ascii_block(content[position:value_end])
+            if npoints is None:
+                raise ValueError(f"{filename} holds a uniform field, `npoints` is needed to expand it")
+            data = np.tile(value, (npoints, 1))
+            return data[:, 0] if ncomponents == 1 else data
+        list_header = list_start.match(content, position)
+        ncomponents = 3 if list_header.group(1) == b'vector' else 1
+        ncells = int(list_header.group(2))
+        remainder = content[list_header.end():]
+        del content
+        if is_binary:
+            nbytes = ncells*ncomponents*np.dtype(scalar_dtype).itemsize
+            raw = remainder[:nbytes]+f.read(max(0, nbytes-len(remainder)))
+            data = np.frombuffer(raw, dtype=scalar_dtype, count=len(raw)//np.dtype(scalar_dtype).itemsize).astype(np.float64)
+        else:
+            # Whole lines are parsed up to the first closing bracket followed by the `;` of the internalField
+            values, count = [], 0
+            while count < ncells*ncomponents:
+                block = f.read(chunk_size)
+                chunk = remainder+block
+                cut = chunk.rfind(b'\n')+1 if block else len(chunk)
+                chunk, remainder = chunk[:cut], chunk[cut:]
+                end = list_end.search(chunk)
+                if end is not None:
+                    chunk = chunk[:end.start()]
+                if chunk.strip():
+                    values.append(parse_ascii_block(chunk, chunk_size))
+                    count += len(values[-1])
+                if end is not None or not block:
+                    break
+            data = np.concatenate(values) if values else np.zeros(0)
+    if len(data) != ncells*ncomponents:
+        raise ValueError(f"{filename} holds {len(data)} values, expected {ncells*ncomponents}")
+    return data if ncomponents == 1 else data.reshape(ncells, ncomponents)
+#
+# Read an OpenFOAM raw sampling file
+#
+def read_raw_samples(filename, ncoordinates=3):
+    '''
+        This function reads the `raw` output of the OpenFOAM sets/surfaces function objects
+        (lines starting with '#' are comments, then coordinate columns followed by the field components)
+    INPUT
+        filename:       [string] Name and location of the raw file
+        ncoordinates:   [integer] Number of coordinate columns (3 for surfaces and xyz sets)
+    OUTPUT
+        coordinates:    [numpy array] (points x ncoordinates) coordinates
+        data:           [numpy array] (points) for scalars or (points x 3) for vectors
+    '''
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rb') as f:
+        content = f.read()
+    lines = content.split(b'\n')
+    body = b'\n'.join(line for line in lines if line.strip() and not line.lstrip().startswith(b'#'))
+    first_line = body[:body.find(b'\n')] if b'\n' in body else body
+    ncolumns = len(first_line.split())
+    values = parse_ascii_block(body).reshape(-1, ncolumns)
+    coordinates = values[:, :ncoordinates]
+    data = values[:, ncoordinates:]
+    return coordinates, (data[:, 0] if data.shape[1] == 1 else data)
+#
+# Read one plane with the selected reader
+#
+def read_plane(filename, reader='vtk'):
+    '''
+        This function returns the coordinates and point data of one sampled plane
+    INPUT
+        filename:       [string] Name and location of the file
+        reader:         [string] 'vtk' (VTK polydata), 'raw' (OpenFOAM raw sets/surfaces output) or
+                        'foam' (OpenFOAM field file, the cell centres are read from the file `C` in
+                        the same directory as written by `postProcess -func writeCellCentres`). A field
+                        file holds every cell of the 3D mesh, `prepare_height` keeps the slab of cells
+                        around the height
+    OUTPUT
+        coordinates:    [numpy array] (points x 3) coordinates
+        data:           [numpy array] (points) for scalars or (points x 3) for vectors
+    '''
+    if reader == 'vtk':
+        return read_vtk_pointdata(filename)
+    if reader == 'raw':
+        return read_raw_samples(filename)
+    if reader == 'foam':
+        coordinates = read_foam_field(cell_centres_filename(filename))
+        return coordinates, read_foam_field(filename, npoints=len(coordinates))
+    raise ValueError(f"Unknown reader `{reader}` | Valid readers: vtk, raw or foam")
+
+def cell_centres_filename(filename):
+    '''
+        This function returns the name of the cell centres file `C` next to an OpenFOAM field file
+    '''
+    return os.path.join(os.path.dirname(filename), 'C'+('.gz' if filename.endswith('.gz') else ''))
+#
+# Point in polygon test
+#
+def points_in_polygon(xy, polygon):
+    '''
+        This function tests which points lie inside a polygon (even-odd ray casting, vectorised over
+        the points for all edges at once, in chunks to bound the temporary memory)
+    INPUT
+        xy:             [numpy array] (points x 2) coordinates
+        polygon:        [numpy array] (vertices x 2) outline, closing the polygon is optional
+    OUTPUT
+        inside:         [numpy array] Boolean array, True for the points inside the polygon
+    '''
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    inside = np.zeros(len(xy), dtype=bool)
+    chunk = max(1, 2**24//len(polygon))
+    for start in range(0, len(xy), chunk):
+        px = xy[start:start+chunk, 0][:, None]
+        py = xy[start:start+chunk, 1][:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossings = ((y0 > py) != (y1 > py)) & (px < (x1-x0)*(py-y0)/(y1-y0)+x0)
+        inside[start:start+chunk] = np.count_nonzero(crossings, axis=1) % 2 == 1
+    return inside
+#
+# Uniform grid hash of the points of a plane
+#
+def build_grid_index(xy, points_per_cell=16):
+    '''
+        This function buckets the points of a plane into a uniform grid of square cells
+    INPUT
+        xy:             [numpy array] (points x 2) coordinates
+        points_per_cell:[integer] Average number of points per cell
+    OUTPUT
+        index:          [dictionary] origin, cell_size and shape of the grid, `order` (points sorted
+                        by cell) and `offsets` (first sorted point of every cell, CSR layout)
+    '''
+    lower, upper = xy.min(axis=0), xy.max(axis=0)
+    cells_per_axis = max(1, int(np.sqrt(len(xy)/points_per_cell)))
+    cell_size = max(float(np.max(upper-lower))/cells_per_axis, np.finfo(float).tiny)
+    shape = np.floor((upper-lower)/cell_size).astype(np.int64)+1
+    cell = np.floor((xy-lower)/cell_size).astype(np.int64)
+    cell_id = cell[:, 0]*shape[1]+cell[:, 1]
+    order = np.argsort(cell_id, kind='stable')
+    offsets = np.searchsorted(cell_id[order], np.arange(shape[0]*shape[1]+1))
+    return {'origin': lower, 'cell_size': cell_size, 'shape': shape, 'order': order, 'offsets': offsets}
+#
+# Polygon mask using the grid index
+#
+def polygon_mask(xy, polygon, index):
+    '''
+        This function returns the points of a plane inside a polygon. Only the points in grid cells
+        crossed by the outline are tested exactly, all other cells are classified by their centre
+    INPUT
+        xy:             [numpy array] (points x 2) coordinates
+        polygon:        [numpy array] (vertices x 2) outline
+        index:          [dictionary] Grid index from `build_grid_index`
+    OUTPUT
+        mask:           [numpy array] Boolean array, True for the points inside the polygon
+    '''
+    shape, cell_size, origin = index['shape'], index['cell_size'], index['origin']
+    ncells = shape[0]*shape[1]
+    # Mark the cells touched by the outline, sampled at half a cell along every edge
+    start, end = polygon, np.roll(polygon, -1, axis=0)
+    nsamples = np.ceil(np.linalg.norm(end-start, axis=1)/(0.5*cell_size)).astype(np.int64)+1
+    edge = np.repeat(np.arange(len(polygon)), nsamples)
+    t = (np.arange(len(edge))-np.repeat(np.cumsum(nsamples)-nsamples, nsamples))/np.repeat(np.maximum(nsamples-1, 1), nsamples)
+    samples = start[edge]+t[:, None]*(end[edge]-start[edge])
+    cell = np.clip(np.floor((samples-origin)/cell_size).astype(np.int64), 0, shape-1)
+    boundary = np.zeros(shape, dtype=bool)
+    boundary[cell[:, 0], cell[:, 1]] = True
+    # Grow by one cell so that cells only clipped by a corner are tested exactly as well
+    padded = np.pad(boundary, 1)
+    boundary = np.zeros(shape, dtype=bool)
+    for di in range(3):
+        for dj in range(3):
+            boundary |= padded[di:di+shape[0], dj:dj+shape[1]]
+    boundary = boundary.ravel()
+    # Cells away from the outline are either fully inside or fully outside
+    counts = np.diff(index['offsets'])
+    interior_cells = np.flatnonzero((counts > 0) & ~boundary)
+    centres = origin+(np.column_stack(np.unravel_index(interior_cells, tuple(shape)))+0.5)*cell_size
+    cell_inside = np.zeros(ncells, dtype=bool)
+    cell_inside[interior_cells] = points_in_polygon(centres, polygon)
+    sorted_cell = np.repeat(np.arange(ncells), counts)
+    sorted_mask = cell_inside[sorted_cell]
+    on_boundary = boundary[sorted_cell]
+    sorted_mask[on_boundary] = points_in_polygon(xy[index['order'][on_boundary]], polygon)
+    mask = np.empty(len(xy), dtype=bool)
+    mask[index['order']] = sorted_mask
+    return mask
+#
+# Build (or reuse) the mask of one height
+#
+def height_mask(coordinates, myz, outdir, bbox=None, polygon=None):
+    '''
+        This function returns the clipping mask of one height. The mask and the grid index are cached in
+        `outdir`/mask_{z}_cache.npz together with a fingerprint of the coordinates, so later runs (and
+        other clipping polygons on the same plane) do not recompute them
+    INPUT
+        coordinates:    [numpy array] (points x 3) coordinates of the plane
+        myz:            [integer] Height
+        outdir:         [string] Output directory
+        bbox:           [tuple] Optional (xmin, xmax, ymin, ymax) bounding box
+        polygon:        [numpy array] Optional (vertices x 2) clipping outline
+    OUTPUT
+        mask:           [numpy array] Boolean array, True for the points that are kept
+        status:         [string] 'cached', 'index reused' or 'built'
+    '''
+    xy = np.ascontiguousarray(coordinates[:, :2], dtype=np.float64)
+    fingerprint = hashlib.sha1(xy.tobytes()).hexdigest()
+    clip_key = hashlib.sha1(repr(None if bbox is None else [float(b) for b in bbox]).encode()+
+                            (b'' if polygon is None else np.ascontiguousarray(polygon, dtype=np.float64).tobytes())).hexdigest()
+    cache_filename = os.path.join(outdir, 'mask_'+str(myz)+'_cache.npz')
+    index = None
+    if os.path.isfile(cache_filename):
+        cache = np.load(cache_filename)
+        if str(cache['fingerprint']) == fingerprint:
+            if str(cache['clip_key']) == clip_key:
+                return cache['mask'], 'cached'
+            index = {key: cache[key] for key in ('origin', 'cell_size', 'shape', 'order', 'offsets')}
+    status = 'built' if index is None else 'index reused'
+    mask = np.ones(len(xy), dtype=bool)
+    if bbox is not None:
+        xmin, xmax, ymin, ymax = bbox
+        mask &= (xy[:, 0] >= xmin) & (xy[:, 0] <= xmax) & (xy[:, 1] >= ymin) & (xy[:, 1] <= ymax)
+    if polygon is not None:
+        if index is None:
+            index = build_grid_index(xy)
+        mask &= polygon_mask(xy, np.asarray(polygon, dtype=np.float64), index)
+    if index is not None:
+        np.savez(cache_filename+'.part.npz', fingerprint=fingerprint, clip_key=clip_key, mask=mask, **index)
+        os.replace(cache_filename+'.part.npz', cache_filename)
+    return mask, status
+#
+# Output file names
+#
+def plane_filenames(outdir, myz, wd, compression=None):
+    '''
+        This function returns the names of the speed and tke files for one height and angle,
+        compressed files get the extension `.bin.zlib`
+    '''
+    extension = '.bin' if compression is None else '.bin.zlib'
+    speed_filename = os.path.join(outdir, 'Umag_'+str(myz)+'_'+str(wd)+extension)
+    tke_filename = os.path.join(outdir, 'TKE_'+str(myz)+'_'+str(wd)+extension)
+    return speed_filename, tke_filename
+#
+# Consolidated container file names
+#
+def plane_index_filename(outdir, myz):
+    '''
+        This function returns the name of the JSON index of one height
+    '''
+    return os.path.join(outdir, 'plane_'+str(myz)+'.json')
+
+def plane_stack_filename(outdir, myz, variable):
+    '''
+        This function returns the name of the (directions x points) stack of one variable at one height
+    '''
+    return os.path.join(outdir, 'plane_'+str(myz)+'_'+variable+'.npy')
+#
+# Write the JSON index and allocate the consolidated stacks of one height
+#
+def write_plane_index(outdir, myz, wind_directions, bbox, mask, output_format, settings):
+    '''
+        This function writes the self-describing JSON index of one height. For the 'stack' format it also
+        allocates one (directions x points) `.npy` stack per variable and a per-direction completion flag,
+        existing stacks with the same layout are kept so that an interrupted job can be resumed
+    INPUT
+        outdir:         [string] Output directory
+        myz:            [integer] Height
+        wind_directions:[list] Angles of the dataset, in row order of the stacks
+        bbox:           [tuple] (xmin, xmax, ymin, ymax) bounding box of the output points or None
+        mask:           [numpy array] Boolean mask over the points of the source plane
+        output_format:  [string] 'bin' (one file per angle) or 'stack' (one stack per variable)
+        settings:       [dictionary] {'dtype', 'compression', 'tolerance', 'reader', 'polygon', 'z_tolerance'} of the conversion
+    OUTPUT
+        index:          [dictionary] Content of the JSON index
+    '''
+    npoints = int(np.count_nonzero(mask))
+    my_datatype = settings['dtype']
+    index = {
+        'format': output_format,
+        'height': myz,
+        'directions': [int(wd) for wd in wind_directions],
+        'npoints': npoints,
+        'dtype': np.dtype(my_datatype).name,
+        'compression': settings['compression'],
+        'scale': None if settings['compression'] != 'quantize' else 2.0*settings['tolerance'],
+        'coordinates': {'x': 'x_'+str(myz)+'.bin', 'y': 'y_'+str(myz)+'.bin', 'dtype': 'float64'},
+        'mask': {'file': 'mask_'+str(myz)+'.npy', 'bbox': None if bbox is None else [float(b) for b in bbox],
+                 'polygon': None if settings['polygon'] is None else np.asarray(settings['polygon'], dtype=float).tolist(),
+                 'z_tolerance': settings.get('z_tolerance'), 'nsource': int(len(mask))},
+    }
+    previous = read_plane_index(plane_index_filename(outdir, myz))
+    if output_format == 'bin':
+        extension = '.bin' if settings['compression'] is None else '.bin.zlib'
+        index['variables'] = {variable: variable+'_'+str(myz)+'_{wd}'+extension for variable in ('Umag', 'TKE')}
+        # Angles whose files were written with the current settings, files written with other settings
+        # are no longer listed and are rewritten by `convert_angle`
+        index['fingerprint'] = output_fingerprint(index, mask)
+        written = previous.get('written', {}) if previous is not None else {}
+        index['written'] = {wd: fingerprint for wd, fingerprint in written.items() if fingerprint == index['fingerprint']}
+    elif output_format == 'stack':
+        if settings['compression'] is not None:
+            raise ValueError("The 'stack' format is memory-mapped and can not be compressed, use the 'bin' format")
+        index['variables'] = {variable: os.path.basename(plane_stack_filename(outdir, myz, variable)) for variable in ('Umag', 'TKE')}
+        index['completed'] = 'plane_'+str(myz)+'_completed.npy'
+        shape = (len(wind_directions), npoints)
+        completed_filename = os.path.join(outdir, index['completed'])
+        # Reuse the stacks of an interrupted run if the layout did not change
+        reuse = previous is not None and all(previous.get(key) == index[key] for key in ('format', 'directions', 'npoints', 'dtype', 'compression', 'mask')) \
+            and os.path.isfile(completed_filename) and all(os.path.isfile(os.path.join(outdir, f)) for f in index['variables'].values())
+        if not reuse:
+            for filename in index['variables'].values():
+                np.lib.format.open_memmap(os.path.join(outdir, filename), mode='w+', dtype=my_datatype, shape=shape).flush()
+            np.save(completed_filename, np.zeros(len(wind_directions), dtype=np.uint8), allow_pickle=False)
+    else:
+        raise ValueError(f"Unknown output format `{output_format}` | Valid formats: bin or stack")
+    save_plane_index(outdir, myz, index)
+    return index
+#
+# Settings fingerprint of the converted files
+#
+def output_fingerprint(index, mask):
+    '''
+        This function returns a hash of everything that determines the content of the converted files of
+        one height: format, number of points, data type, compression, quantisation step and mask
+    '''
+    settings = json.dumps({key: index[key] for key in ('format', 'npoints', 'dtype', 'compression', 'scale', 'mask')}, sort_keys=True)
+    return hashlib.sha1(settings.encode()+np.packbits(mask).tobytes()).hexdigest()
+#
+# Write the JSON index of one height
+#
+def save_plane_index(outdir, myz, index):
+    '''
+        This function writes the JSON index of one height, the file is replaced atomically
+    '''
+    filename = plane_index_filename(outdir, myz)
+    with open(filename+'.part', 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(filename+'.part', filename)
+
+def record_converted(outdir, myz, wd):
+    '''
+        This function records in the JSON index of one height that the files of angle `wd` were written
+        with the current settings. Only the parent process of `convert_planes` writes the index
+    '''
+    index = read_plane_index(plane_index_filename(outdir, myz))
+    index['written'][str(wd)] = index['fingerprint']
+    save_plane_index(outdir, myz, index)
+#
+# Read the JSON index of one height
+#
+def read_plane_index(filename):
+    '''
+        This function returns the content of a JSON index, or None if it does not exist
+    '''
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, 'r') as f:
+        return json.load(f)
+#
+# Build the bounding box mask and write the coordinates of one height
+#
+def prepare_height(args):
+    '''
+        This function builds the bounding box (and polygon) mask for one height from the first angle and
+        writes the filtered x and y coordinates, the mask and the JSON index (see `write_plane_index`) to `outdir`
+    INPUT
+        args:           [tuple] (ufile, myz, bbox, outdir, wind_directions, output_format, settings)
+                        with bbox = (xmin, xmax, ymin, ymax) or None
+    OUTPUT
+        myz:            [integer] Height that was prepared
+        npoints:        [integer] Number of points inside the clipping region
+        status:         [string] How the mask was obtained (see `height_mask`)
+    '''
+    ufile, myz, bbox, outdir, wind_directions, output_format, settings = args
+    if settings['reader'] == 'foam':
+        # Only the cell centres are needed. Field files hold all cells of the mesh, keep the cells whose
+        # centre is within z_tolerance of the height
+        coordinates = read_foam_field(cell_centres_filename(ufile))
+        in_slab = np.flatnonzero(np.abs(coordinates[:, 2]-myz) <= settings['z_tolerance'])
+        if len(in_slab) == 0:
+            raise ValueError(f"No cell centre within {settings['z_tolerance']} of height {myz}")
+        slab_mask, status = height_mask(coordinates[in_slab], myz, outdir, bbox, settings['polygon'])
+        mask = np.zeros(len(coordinates), dtype=bool)
+        mask[in_slab[slab_mask]] = True
+    else:
+        coordinates, _ = read_plane(ufile, settings['reader'])
+        mask, status = height_mask(coordinates, myz, outdir, bbox, settings['polygon'])
+    # Write the coordinates to file for this height
+    save_to_binary(os.path.join(outdir, 'x_'+str(myz)+'.bin'), coordinates[mask, 0])
+    save_to_binary(os.path.join(outdir, 'y_'+str(myz)+'.bin'), coordinates[mask, 1])
+    np.save(os.path.join(outdir, 'mask_'+str(myz)+'.npy'), mask, allow_pickle=False)
+    write_plane_index(outdir, myz, wind_directions, bbox, mask, output_format, settings)
+    return myz, int(np.count_nonzero(mask)), status
+#
+# Convert the heights of one angle
+#
+def convert_angle(args):
+    '''
+        This function converts the U and k files of one angle to mag(U) and tke binary files, or to row
+        `row` of the consolidated stacks, for every height these files hold. The input files are read
+        once: for the 'vtk' and 'raw' readers every height has its own files, OpenFOAM field files
+        ('foam' reader) hold the full mesh and all heights are cut from the same arrays. Pairs whose
+        outputs were already written with the settings recorded in the JSON index of the height (and,
+        uncompressed, have the expected size), or rows flagged as completed, are skipped so that an
+        interrupted job can be resumed.
+    INPUT
+        args:           [tuple] (ufile, tkefile, heights, wd, row, outdir, output_format, settings)
+    OUTPUT
+        results:        [list] (myz, wd, status, bytes_read, bytes_written, seconds, message) for every
+                        height, with status 'converted', 'skipped' or 'failed'
+    '''
+    ufile, tkefile, heights, wd, row, outdir, output_format, settings = args
+    my_datatype, compression = settings['dtype'], settings['compression']
+    time1 = time.time()
+    results, masks = [], {}
+    for myz in heights:
+        try:
+            mask = np.load(os.path.join(outdir, 'mask_'+str(myz)+'.npy'))
+            if pair_is_converted(myz, wd, row, outdir, output_format, settings, mask):
+                results.append((myz, wd, 'skipped', 0, 0, time.time()-time1, ''))
+            else:
+                masks[myz] = mask
+        except Exception as e:
+            results.append((myz, wd, 'failed', 0, 0, time.time()-time1, f"{type(e).__name__}: {e}"))
+    if not masks:
+        return results
+    # Read the data once for all heights
+    try:
+        if settings['reader'] == 'foam':
+            # The cell centres are not needed here, the number of cells expands `uniform` fields
+            npoints = len(next(iter(masks.values())))
+            Udata, tke = read_foam_field(ufile, npoints=npoints), read_foam_field(tkefile, npoints=npoints)
+        else:
+            _, Udata = read_plane(ufile, settings['reader'])
+            _, tke = read_plane(tkefile, settings['reader'])
+        bytes_read = os.path.getsize(ufile)+os.path.getsize(tkefile)
+    except Exception as e:
+        return results+[(myz, wd, 'failed', 0, 0, time.time()-time1, f"{type(e).__name__}: {e}") for myz in masks]
+    for myz, mask in masks.items():
+        try:
+            if len(Udata) != len(mask) or len(tke) != len(mask):
+                raise ValueError(f"number of points differs from the mask of height {myz} ({len(mask)} points)")
+            # Continue writing data for tke and mag(U)
+            filter_speed = np.sqrt(Udata[mask,0]**2+Udata[mask,1]**2+Udata[mask,2]**2)
+            filter_tke = tke[mask]
+            expected_size = np.count_nonzero(mask)*np.dtype(my_datatype).itemsize
+            if output_format == 'stack':
+                # Write the row of every variable before flagging the direction as completed
+                for variable, values in (('Umag', filter_speed), ('TKE', filter_tke)):
+                    stack = np.load(plane_stack_filename(outdir, myz, variable), mmap_mode='r+')
+                    stack[row, :] = values
+                    stack.flush()
+                    del stack
+                completed = np.load(os.path.join(outdir, 'plane_'+str(myz)+'_completed.npy'), mmap_mode='r+')
+                completed[row] = 1
+                completed.flush()
+                del completed
+                bytes_written = 2*expected_size
+            elif compression is not None:
+                speed_filename, tke_filename = plane_filenames(outdir, myz, wd, compression)
+                save_to_compressed(speed_filename,filter_speed,my_datatype,compression,settings['tolerance'])
+                save_to_compressed(tke_filename,filter_tke,my_datatype,compression,settings['tolerance'])
+                bytes_written = os.path.getsize(speed_filename)+os.path.getsize(tke_filename)
+            else:
+                speed_filename, tke_filename = plane_filenames(outdir, myz, wd, compression)
+                save_to_binary(speed_filename,filter_speed,my_datatype)
+                save_to_binary(tke_filename,filter_tke,my_datatype)
+                bytes_written = 2*expected_size
+            # The input files are counted once, with the first converted height
+            results.append((myz, wd, 'converted', bytes_read, bytes_written, time.time()-time1, ''))
+            bytes_read = 0
+        except Exception as e:
+            results.append((myz, wd, 'failed', 0, 0, time.time()-time1, f"{type(e).__name__}: {e}"))
+    return results
+#
+# Check whether one (height, angle) pair was converted
+#
+def pair_is_converted(myz, wd, row, outdir, output_format, settings, mask):
+    '''
+        This function returns True if the outputs of one (height, angle) pair exist and were written with
+        the current settings (see `convert_angle`)
+    '''
+    my_datatype, compression = settings['dtype'], settings['compression']
+    if output_format == 'stack':
+        return bool(np.load(os.path.join(outdir, 'plane_'+str(myz)+'_completed.npy'), mmap_mode='r')[row])
+    expected_size = np.count_nonzero(mask)*np.dtype(my_datatype).itemsize
+    speed_filename, tke_filename = plane_filenames(outdir, myz, wd, compression)
+    index = read_plane_index(plane_index_filename(outdir, myz))
+    scale = None if compression != 'quantize' else 2.0*settings['tolerance']
+    up_to_date = index is not None and 'fingerprint' in index and index['dtype'] == np.dtype(my_datatype).name \
+        and index['compression'] == compression and index['scale'] == scale \
+        and index['written'].get(str(wd)) == index['fingerprint']
+    return up_to_date and all(os.path.isfile(f) and (compression is not None or os.path.getsize(f) == expected_size)
+                              for f in (speed_filename, tke_filename))
+#
+# Convert all heights and angles in parallel
+#
+def convert_planes(file_template, zloc, wind_directions, bbox, vars=('U','k'), outdir='data',
+                   n_processes=None, my_datatype=np.float64, check_files=False, start_method=None,
+                   output_format='bin', compression=None, tolerance=None, reader='vtk', polygon=None,
+                   z_tolerance=None):
+    '''
+        This function converts the U and k planes of all (height, angle) pairs to binary
+        files using a pool of processes, and reports the throughput at the end
+    INPUT
+        file_template:  [string] Name of the input files with the placeholders {wd}, {z} and {var}
+                        e.g. '../{wd}/postProcessing/sampling_planes/1200/zcut_{z}_{var}.vtk'
+        zloc:           [list] Heights where the data is available
+        wind_directions:[list] Angles of the dataset, the mask of every height is built from the first angle
+        bbox:           [tuple] (xmin, xmax, ymin, ymax) bounding box of the output points or None
+        vars:           [tuple] Names of the velocity and tke variables in the file names
+        outdir:         [string] Output directory
+        n_processes:    [integer] Number of worker processes (default all available cores)
+        my_datatype:    [numpy dtype] Data type on disk (float64, float32 or float16)
+        check_files:    [Boolean] Check that all input files exist before starting
+        start_method:   [string] Multiprocessing start method (default platform default)
+        output_format:  [string] 'bin' writes Umag_{z}_{wd}.bin and TKE_{z}_{wd}.bin per angle, 'stack'
+                        writes one (directions x points) plane_{z}_{Umag,TKE}.npy per height.
+                        Both write the JSON index plane_{z}.json describing the layout
+        compression:    [string] None, 'zlib' (lossless) or 'quantize' (absolute error <= tolerance),
+                        only for the 'bin' format, written as Umag_{z}_{wd}.bin.zlib
+        tolerance:      [float] Maximum absolute error of the 'quantize' compression
+        reader:         [string] 'vtk', 'raw' or 'foam' (see `read_plane`), 'raw' and 'foam' do not import vtk
+        polygon:        [numpy array or string] Optional (vertices x 2) clipping outline, or a text file with
+                        x y columns (e.g. a neighbourhood outline). The mask and its grid index are cached per height
+        z_tolerance:    [float] Only for the 'foam' reader: the heights in `zloc` are z coordinates and the cells
+                        whose centre is within z_tolerance of the height are kept (e.g. half the cell height)
+    OUTPUT
+        failed:         [list] (height, angle, message) of the pairs that could not be converted
+    '''
+    def input_files(myz, wd):
+        return file_template.format(wd=wd, z=myz, var=vars[0]), file_template.format(wd=wd, z=myz, var=vars[1])
+    # Assert output directory exists, if not create it
+    os.makedirs(outdir, exist_ok=True)
+    if check_files:
+        missing = [f for myz in zloc for wd in wind_directions for f in input_files(myz, wd) if not os.path.isfile(f)]
+        if missing:
+            print("\n".join(missing))
+            print("Above files are missing....")
+            return [(None, None, f"missing {f}") for f in missing]
+        print("All files for conversion present")
+    if compression == 'quantize' and not tolerance:
+        raise ValueError("The 'quantize' compression needs a positive tolerance")
+    if reader == 'foam' and z_tolerance is None:
+        raise ValueError("The 'foam' reader reads all cells of the mesh and needs z_tolerance to select the cells of every height")
+    if isinstance(polygon, str):
+        polygon = np.loadtxt(polygon)[:, :2]
+    settings = {'dtype': np.dtype(my_datatype).name, 'compression': compression, 'tolerance': tolerance,
+                'reader': reader, 'polygon': polygon, 'z_tolerance': z_tolerance}
+    if n_processes is None:
+        n_processes = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    # One task per set of input files, the heights of an OpenFOAM field file are converted from one read
+    heights = {}
+    for row, wd in enumerate(wind_directions):
+        for myz in zloc:
+            heights.setdefault((*input_files(myz, wd), wd, row), []).append(myz)
+    tasks = [(ufile, tkefile, task_heights, wd, row, outdir, output_format, settings)
+             for (ufile, tkefile, wd, row), task_heights in heights.items()]
+    print(f"Starting {reader.upper()} 2 Binary conversion of {len(zloc)*len(wind_directions)} (height, angle) pairs "
+          f"in {len(tasks)} tasks on {n_processes} processes....")
+    time_start = time.time()
+    failed = []
+    converted, skipped, bytes_read, bytes_written = 0, 0, 0, 0
+    with mp.get_context(start_method).Pool(processes=min(n_processes, len(tasks))) as pool:
+        # Masks and coordinates, one task per height
+        for myz, npoints, status in pool.imap_unordered(prepare_height, [(input_files(myz, wind_directions[0])[0], myz, bbox, outdir,
+                                                                        wind_directions, output_format, settings) for myz in zloc]):
+            print(f"Height: {myz} | {npoints} points inside the clipping region (mask {status})")
+        # All (height, angle) pairs
+        for myz, wd, status, nread, nwritten, seconds, message in (result for results in pool.imap_unordered(convert_angle, tasks)
+                                                                    for result in results):
+            if status == 'failed':
+                failed.append((myz, wd, message))
+                print(f"Case - Height: {myz} | theta: {wd} FAILED: {message}")
+                continue
+            if status == 'converted' and output_format == 'bin':
+                record_converted(outdir, myz, wd)
+            converted += status == 'converted'
+            skipped += status == 'skipped'
+            bytes_read += nread
+            bytes_written += nwritten
+            print(f"Case - Height: {myz} | theta: {wd} {status} in {seconds:.2f} seconds")
+    elapsed = time.time()-time_start
+    print(f"Converted {converted} pairs ({2*converted} files), skipped {skipped}, failed {len(failed)} in {elapsed:.1f} seconds")
+    print(f"Throughput: {2*converted/elapsed:.2f} files/s | read {bytes_read/1e6/elapsed:.1f} MB/s | written {bytes_written/1e6/elapsed:.1f} MB/s")
+    return failed
@@ -1,14 +1,17 @@
 import numpy as np
-import random
+import os
+import json
+import zlib
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 from mpl_toolkits.mplot3d import Axes3D
-import trimesh
 import sys
+import re
+from collections import namedtuple
 #
 # Function that outputs the sampled points
 #
-def generate_uniform_points(x_min, x_max, y_min, y_max, z_min, z_max, num_points,savePoints2File=False):
+def generate_uniform_points(x_min, x_max, y_min, y_max, z_min, z_max, num_points,savePoints2File=False,seed=None,method='uniform'):
     '''
     Generate uniformly distributed points within specified limits for x, y, and z coordinates.
     
@@ -21,24 +24,53 @@ def generate_uniform_points(x_min, x_max, y_min, y_max, z_min, z_max, num_points
     z_max (float): Maximum limit for z coordinate.
     num_points (int): Number of points to generate.
     savePoints2File (Boolean): Save points to a text file
+    seed (int): Seed of the random stream, the same seed gives the same points (None: not reproducible)
+    method (str): 'uniform' (independent random points), 'stratified' (one jittered point in each of
+                  num_points cells of a grid with cell counts proportional to the box sides), or 'sobol'
+                  and 'halton' (scrambled quasi-random sequences, needs scipy)
     
     Returns:
-    list: List of generated points as tuples (x, y, z).
-    '''
-    points = []
-    for _ in range(num_points):
-        x = random.uniform(x_min, x_max)
-        y = random.uniform(y_min, y_max)
-        z = random.uniform(z_min, z_max)
-        # Force round to 4 places
-        x = round(x,4)
-        y = round(y,4)
-        z = round(z,4)
-        points.append((x, y, z))
+    numpy array: (num_points x 3) array of generated points (x, y, z), rounded to 4 places.
+    '''
+    lower = np.array([x_min, y_min, z_min], dtype=float)
+    upper = np.array([x_max, y_max, z_max], dtype=float)
+    rng = np.random.default_rng(seed)
+    if method == 'uniform':
+        unit = rng.random((num_points, 3))
+    elif method == 'stratified':
+        # Grid with at least num_points cells, cell counts proportional to the box sides.
+        # Flat axes (e.g. a plane of pedestrian-level probes) get a single cell
+        extent = upper-lower
+        active = extent > 0
+        cells = np.ones(3, dtype=np.int64)
+        if active.any():
+            sides = extent[active]
+            cells[active] = np.maximum(1, np.ceil(sides*(num_points/np.prod(sides))**(1/active.sum()))).astype(np.int64)
+            while np.prod(cells) < num_points:
+                cells[np.argmax(np.where(active, extent/cells, -1))] += 1
+            # Draw num_points distinct cells and jitter the point inside every cell
+            chosen = rng.choice(np.prod(cells), size=num_points, replace=False)
+            index = np.column_stack(np.unravel_index(chosen, tuple(cells)))
+            unit = (index+rng.random((num_points, 3)))/cells
+        else:
+            # A single point, all samples coincide
+            unit = rng.random((num_points, 3))
+    elif method in ('sobol', 'halton'):
+        import warnings
+        from scipy.stats import qmc
+        sampler = qmc.Sobol(d=3, seed=rng) if method == 'sobol' else qmc.Halton(d=3, seed=rng)
+        with warnings.catch_warnings():
+            # Sobol sequences are balanced for powers of two but valid for any length
+            warnings.simplefilter('ignore')
+            unit = sampler.random(num_points)
+    else:
+        sys.exit("\033[1;31;47mError: Unknown sampling method `%s` | Valid methods: uniform, stratified, sobol or halton...\033[0m" % (method))
+    # Force round to 4 places
+    points = np.round(lower+unit*(upper-lower), 4)
     
     # Write the points to file
     if(savePoints2File):
-        np.savetxt('points.csv',np.array(points),header='X Y Z',comments='')
+        np.savetxt('points.csv',points,header='X Y Z',comments='')
 
     return points
 #
@@ -66,29 +98,285 @@ def plot_only_points(points,figx=14,figy=8):
 #
 # Load the obj file
 #
-def load_obj(file_path):
+def load_obj(file_path, use_trimesh=False):
     '''
-        This function loads the mesh and returns the mesh object using trimesh
+        This function loads the mesh and returns an object with `vertices` and `faces` (see `read_obj`),
+        or the trimesh mesh object if `use_trimesh`
     '''
-    return trimesh.load(file_path,force='mesh')
+    if use_trimesh:
+        import trimesh
+        return trimesh.load(file_path,force='mesh')
+    return read_obj(file_path)
 #
-# Plot the mesh and the points together
+# Uniform xy grid over the triangles of a mesh
 #
-def plot_mesh_and_points(mesh, points,figx=14,figy=8, saveMyFigure=False):
+def build_face_grid(vertices, faces, margin=0.0, faces_per_cell=8):
     '''
-        This function plots the mesh as a surface and points generated and returns the figure
+        This function buckets the triangles of a mesh into a uniform grid in the xy plane. Every
+        triangle is stored in all cells overlapped by its xy bounding box grown by `margin`, so one
+        cell lookup returns all triangles that can be hit by a vertical ray through a point or that
+        are closer than `margin` to it
+    INPUT
+        vertices:       [numpy array] (vertices x 3) coordinates
+        faces:          [numpy array] (faces x 3) vertex indices of the triangles
+        margin:         [float] Growth of the triangle boxes (the clearance of `mesh_clearance_mask`)
+        faces_per_cell: [integer] Target average number of triangles per cell
+    OUTPUT
+        grid:           [dictionary] origin, cell_size, shape, `faces` (triangle ids sorted by cell)
+                        and `offsets` (first entry of every cell, CSR layout) plus the triangle corners
     '''
+    triangles = np.asarray(vertices, dtype=float)[np.asarray(faces)]
+    lower = triangles[:, :, :2].min(axis=1)-margin
+    upper = triangles[:, :, :2].max(axis=1)+margin
+    origin = lower.min(axis=0)
+    extent = np.maximum(upper.max(axis=0)-origin, np.finfo(float).tiny)
+    cell_size = float(np.sqrt(np.prod(extent)*faces_per_cell/len(triangles)))
+    shape = np.floor(extent/cell_size).astype(np.int64)+1
+    first = np.floor((lower-origin)/cell_size).astype(np.int64)
+    last = np.minimum(np.floor((upper-origin)/cell_size).astype(np.int64), shape-1)
+    span = last-first+1
+    # Expand every triangle to the cells of its box
+    counts = span[:, 0]*span[:, 1]
+    face = np.repeat(np.arange(len(triangles)), counts)
+    local = np.arange(counts.sum())-np.repeat(np.cumsum(counts)-counts, counts)
+    i = first[face, 0]+local//span[face, 1]
+    j = first[face, 1]+local % span[face, 1]
+    cell = i*shape[1]+j
+    order = np.argsort(cell, kind='stable')
+    offsets = np.searchsorted(cell[order], np.arange(shape[0]*shape[1]+1))
+    return {'origin': origin, 'cell_size': cell_size, 'shape': shape, 'faces': face[order],
+            'offsets': offsets, 'triangles': triangles, 'margin': margin}
+#
+# Candidate (point, triangle) pairs from the grid, in chunks
+#
+def _grid_pairs(points, grid, max_pairs=2**22):
+    cell = np.floor((points[:, :2]-grid['origin'])/grid['cell_size']).astype(np.int64)
+    outside = np.any((cell < 0) | (cell >= grid['shape']), axis=1)
+    cell = np.clip(cell, 0, grid['shape']-1)
+    cell_id = cell[:, 0]*grid['shape'][1]+cell[:, 1]
+    start = grid['offsets'][cell_id]
+    counts = np.where(outside, 0, grid['offsets'][cell_id+1]-start)
+    # Split the points so that every chunk has at most about max_pairs pairs
+    cumulative = np.cumsum(counts)
+    first = 0
+    while first < len(points):
+        done = cumulative[first-1] if first else 0
+        last = max(first+1, int(np.searchsorted(cumulative, done+max_pairs, side='right')))
+        n = counts[first:last]
+        point = np.repeat(np.arange(first, last), n)
+        entry = np.repeat(start[first:last]-np.cumsum(n)+n, n)+np.arange(n.sum())
+        yield point, grid['faces'][entry]
+        first = last
+#
+# Inside test with vertical rays
+#
+def points_inside_mesh(points, grid):
+    '''
+        This function tests which points are inside the buildings by counting the crossings of a
+        vertical ray going up from every point (odd: inside). Open building meshes without a floor
+        work as well since the ray only goes up
+    INPUT
+        points:         [numpy array] (points x 3) coordinates
+        grid:           [dictionary] Triangle grid from `build_face_grid`
+    OUTPUT
+        inside:         [numpy array] Boolean array, True for the points inside the mesh
+    '''
+    points = np.asarray(points, dtype=float)
+    # A tiny fixed shift keeps the rays away from shared edges and vertices of the triangles
+    query = points+np.array([1.0e-7, 1.3e-7, 0.0])*grid['cell_size']
+    crossings = np.zeros(len(points), dtype=np.int64)
+    for point, face in _grid_pairs(query, grid):
+        a, b, c = (grid['triangles'][face, k] for k in range(3))
+        p = query[point]
+        # Barycentric coordinates in the xy plane, vertical triangles (walls) are skipped
+        det = (b[:, 0]-a[:, 0])*(c[:, 1]-a[:, 1])-(c[:, 0]-a[:, 0])*(b[:, 1]-a[:, 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            u = ((p[:, 0]-a[:, 0])*(c[:, 1]-a[:, 1])-(c[:, 0]-a[:, 0])*(p[:, 1]-a[:, 1]))/det
+            v = ((b[:, 0]-a[:, 0])*(p[:, 1]-a[:, 1])-(p[:, 0]-a[:, 0])*(b[:, 1]-a[:, 1]))/det
+            hit = (det != 0) & (u >= 0) & (v >= 0) & (u+v <= 1)
+            hit &= a[:, 2]+u*(b[:, 2]-a[:, 2])+v*(c[:, 2]-a[:, 2]) > p[:, 2]
+        crossings += np.bincount(point[hit], minlength=len(points))
+    return crossings % 2 == 1
+#
+# Clearance test
+#
+def _closest_point_on_triangles(p, a, b, c):
+    # Closest point on triangle abc to p for arrays of (pairs x 3) (Ericson, Real-Time Collision Detection)
+    ab, ac, ap = b-a, c-a, p-a
+    d1, d2 = np.einsum('ij,ij->i', ab, ap), np.einsum('ij,ij->i', ac, ap)
+    bp = p-b
+    d3, d4 = np.einsum('ij,ij->i', ab, bp), np.einsum('ij,ij->i', ac, bp)
+    cp = p-c
+    d5, d6 = np.einsum('ij,ij->i', ab, cp), np.einsum('ij,ij->i', ac, cp)
+    va, vb, vc = d3*d6-d5*d4, d5*d2-d1*d6, d1*d4-d3*d2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Interior of the face
+        denom = va+vb+vc
+        v, w = vb/denom, vc/denom
+        closest = a+v[:, None]*ab+w[:, None]*ac
+        # Edges
+        edge_bc = (va <= 0) & (d4-d3 >= 0) & (d5-d6 >= 0)
+        t = (d4-d3)/((d4-d3)+(d5-d6))
+        closest = np.where(edge_bc[:, None], b+t[:, None]*(c-b), closest)
+        edge_ac = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        t = d2/(d2-d6)
+        closest = np.where(edge_ac[:, None], a+t[:, None]*ac, closest)
+        edge_ab = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        t = d1/(d1-d3)
+        closest = np.where(edge_ab[:, None], a+t[:, None]*ab, closest)
+    # Vertices
+    closest = np.where(((d6 >= 0) & (d5 <= d6))[:, None], c, closest)
+    closest = np.where(((d3 >= 0) & (d4 <= d3))[:, None], b, closest)
+    closest = np.where(((d1 <= 0) & (d2 <= 0))[:, None], a, closest)
+    # Degenerate (zero area) triangles fall back to the nearest vertex
+    degenerate = ~np.isfinite(closest).all(axis=1)
+    if np.any(degenerate):
+        corners = np.stack([a[degenerate], b[degenerate], c[degenerate]], axis=1)
+        nearest = np.argmin(np.linalg.norm(corners-p[degenerate][:, None], axis=2), axis=1)
+        closest[degenerate] = corners[np.arange(len(nearest)), nearest]
+    return closest
 
-    fig = plt.figure(figsize=(figx, figy))
+def mesh_clearance_mask(points, grid, clearance):
+    '''
+        This function tests which points are closer than `clearance` to any triangle of the mesh
+    INPUT
+        points:         [numpy array] (points x 3) coordinates
+        grid:           [dictionary] Triangle grid from `build_face_grid` built with margin >= clearance
+        clearance:      [float] Minimum distance to the mesh
+    OUTPUT
+        too_close:      [numpy array] Boolean array, True for the points within `clearance` of the mesh
+    '''
+    if clearance > grid['margin']:
+        sys.exit("\033[1;31;47mError: The face grid was built with a margin smaller than the clearance...\033[0m")
+    points = np.asarray(points, dtype=float)
+    too_close = np.zeros(len(points), dtype=bool)
+    for point, face in _grid_pairs(points, grid):
+        triangles = grid['triangles'][face]
+        p = points[point]
+        # Cheap box test before the exact distance
+        near = np.all((p >= triangles.min(axis=1)-clearance) & (p <= triangles.max(axis=1)+clearance), axis=1)
+        point, triangles, p = point[near], triangles[near], p[near]
+        closest = _closest_point_on_triangles(p, triangles[:, 0], triangles[:, 1], triangles[:, 2])
+        hit = np.einsum('ij,ij->i', p-closest, p-closest) < clearance**2
+        too_close[point[hit]] = True
+    return too_close
+#
+# Sampling points outside the buildings
+#
+def generate_points_outside_mesh(x_min, x_max, y_min, y_max, z_min, z_max, num_points, mesh, clearance=0.0,
+                                 savePoints2File=False, seed=None, method='uniform'):
+    '''
+        This function generates points as `generate_uniform_points` but discards the points inside the
+        mesh or closer than `clearance` to it. Candidates are drawn in one batch sized from the rejection
+        rate of a first batch, and the first `num_points` valid candidates are kept, so the result is
+        reproducible for a given seed
+    INPUT
+        mesh:           [object or tuple] Mesh with `vertices` and `faces` (e.g. from `load_obj`) or a (vertices, faces) tuple
+        clearance:      [float] Minimum distance of the points to the mesh
+        others:         see `generate_uniform_points`
+    OUTPUT
+        points:         [numpy array] (num_points x 3) valid points
+    '''
+    vertices, faces = (mesh.vertices, mesh.faces) if hasattr(mesh, 'faces') else mesh
+    grid = build_face_grid(vertices, faces, margin=clearance)
+    num_candidates = num_points
+    for attempt in range(20):
+        candidates = generate_uniform_points(x_min, x_max, y_min, y_max, z_min, z_max, num_candidates, seed=seed, method=method)
+        valid = ~points_inside_mesh(candidates, grid)
+        if clearance > 0:
+            valid[valid] = ~mesh_clearance_mask(candidates[valid], grid, clearance)
+        nvalid = np.count_nonzero(valid)
+        if nvalid >= num_points:
+            break
+        # Grow the batch from the observed acceptance rate
+        num_candidates = int(np.ceil(1.2*num_points*num_candidates/max(nvalid, 1)))
+    else:
+        sys.exit("\033[1;31;47mError: Could not find %d points outside the mesh, only %d...\033[0m" % (num_points, nvalid))
+    points = candidates[valid][:num_points]
+    # Write the points to file
+    if(savePoints2File):
+        np.savetxt('points.csv',points,header='X Y Z',comments='')
+    return points
+#
+# Reduce the mesh and the points to a plotting budget
+#
+def decimate_mesh(vertices, faces, max_faces=20000):
+    '''
+        This function simplifies a mesh by vertex clustering: vertices are merged per cell of a uniform
+        grid and the triangles that collapse are dropped. The cells are grown until at most `max_faces`
+        triangles are left, which keeps the outline of the buildings for a preview
+    INPUT
+        vertices:       [numpy array] (vertices x 3) coordinates
+        faces:          [numpy array] (faces x 3) vertex indices
+        max_faces:      [integer] Maximum number of triangles
+    OUTPUT
+        vertices:       [numpy array] Cluster centres
+        faces:          [numpy array] Remaining triangles
+    '''
+    vertices, faces = np.asarray(vertices, dtype=float), np.asarray(faces)
+    if len(faces) <= max_faces:
+        return vertices, faces
+    lower = vertices.min(axis=0)
+    extent = np.maximum(vertices.max(axis=0)-lower, np.finfo(float).tiny)
+    # Start with about one cell per target triangle on the bounding box surface
+    cell_size = np.sqrt(2*(extent[0]*extent[1]+extent[1]*extent[2]+extent[0]*extent[2])/max_faces)
+    while True:
+        cell = np.floor((vertices-lower)/cell_size).astype(np.int64)
+        _, cluster, cluster_size = np.unique(cell, axis=0, return_inverse=True, return_counts=True)
+        cluster = cluster.ravel()
+        collapsed = cluster[faces]
+        keep = (collapsed[:, 0] != collapsed[:, 1]) & (collapsed[:, 1] != collapsed[:, 2]) & (collapsed[:, 0] != collapsed[:, 2])
+        collapsed = collapsed[keep]
+        # Triangles that became identical are kept once
+        _, unique = np.unique(np.sort(collapsed, axis=1), axis=0, return_index=True)
+        collapsed = collapsed[np.sort(unique)]
+        if len(collapsed) <= max_faces:
+            break
+        cell_size *= 1.25
+    centres = np.zeros((len(cluster_size), 3))
+    np.add.at(centres, cluster, vertices)
+    return centres/cluster_size[:, None], collapsed
+
+def subsample_points(points, max_points=5000, seed=0):
+    '''
+        This function returns at most `max_points` of the points, drawn at random in their original order
+    '''
+    points = np.asarray(points, dtype=float)
+    if len(points) <= max_points:
+        return points
+    rng = np.random.default_rng(seed)
+    return points[np.sort(rng.choice(len(points), size=max_points, replace=False))]
+#
+# Plot the mesh and the points together
+#
+def plot_mesh_and_points(mesh, points,figx=14,figy=8, saveMyFigure=False, max_faces=20000, max_points=5000,
+                         offscreen=False, figureName='samplingPoints.png'):
+    '''
+        This function plots the mesh as a surface and points generated and returns the figure. Large meshes
+        are decimated to `max_faces` triangles and the points subsampled to `max_points` (None: plot all).
+        With `offscreen` the figure is drawn with the Agg backend and saved to `figureName` without
+        opening a window (e.g. on a login node)
+    '''
+    if offscreen:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure(figsize=(figx, figy))
+        FigureCanvasAgg(fig)
+    else:
+        fig = plt.figure(figsize=(figx, figy))
     ax = fig.add_subplot(projection='3d')
     
     # Plot the mesh
     vertices = mesh.vertices
     faces = mesh.faces
+    if max_faces is not None:
+        vertices, faces = decimate_mesh(vertices, faces, max_faces)
     x_coords, y_coords, z_coords = vertices[:, 0], vertices[:, 1], vertices[:, 2]
     ax.plot_trisurf(x_coords, y_coords, faces, z_coords, linewidth=0.2, edgecolor='black', alpha=0.8)
     
     # Plot the generated points
+    if max_points is not None:
+        points = subsample_points(points, max_points)
     x_coords, y_coords, z_coords = zip(*points)
     ax.scatter(x_coords, y_coords, z_coords, c='r', marker='o', label=r'Sampling Points')
     
@@ -106,67 +394,708 @@ def plot_mesh_and_points(mesh, points,figx=14,figy=8, saveMyFigure=False):
     ax.yaxis.set_major_locator(MaxNLocator(integer=True))
     ax.zaxis.set_major_locator(MaxNLocator(integer=True))
     # Save figure if user prompts
-    if(saveMyFigure):
-        plt.savefig('samplingPoints.png',dpi=500)
-    plt.show()
+    if(saveMyFigure or offscreen):
+        fig.savefig(figureName,dpi=500)
+    if not offscreen:
+        plt.show()
+    return fig
 #
-# Function to read the probes
+# Read the header of a probe file
 #
-def readFoamProbes(filename,numProbes=10,fieldName='scalar'):
+def readFoamProbeHeader(filename):
     '''
-        This function reads the OpenFOAM generated probes as numpy arrays
+        This function reads the header of an OpenFOAM probe file
     INPUT
         filename:   [string] Name and location of the file containing the data
-        numProbes:  [integer] Number of points sampled in the domain
-        fieldname:  [string] Scalar or vector quantity to be read
-    OUTPUT
-        dataout:    [numpy array] Returns a numpy array for the `fieldName`
-    '''
-    # Commented to make it compatible with older python versions as match case does not work with older python
-    # match fieldName:
-    #     case 'scalar':
-    #         dataout = np.loadtxt(filename,skiprows=numProbes+2)            
-    #     case 'vector':
-    #         #dataout = np.loadtxt(filename,skiprows=numProbes+2)
-    #         with open(filename,'r') as file:
-    #             lines = file.readlines()[numProbes+2:]
-    #         procLines = [line.replace('(', '').replace(')', '').split() for line in lines]
-    #         dataout = np.array(procLines,dtype=float)
-    #     case _:
-    #         sys.exit("\033[1;31;47mError: Unknown field type `%s` | Valid field type: scalar or vector...\033[0m"%(fieldName))
-    if fieldName == 'scalar':
-        dataout = np.loadtxt(filename, skiprows=numProbes+2)
-    elif fieldName == 'vector':
-        with open(filename, 'r') as file:
-            lines = file.readlines()[numProbes+2:]
-            procLines = [line.replace('(', '').replace(')', '').split() for line in lines]
-            dataout = np.array(procLines, dtype=float)
-    else:
-        import sys
+    OUTPUT
+        locations:  [numpy array] (probes x 3) locations from the `# Probe i (x y z)` lines
+        dataStart:  [integer] Byte offset of the first data line
+    '''
+    locations = []
+    dataStart = 0
+    with open(filename, 'rb') as file:
+        for line in file:
+            if not line.startswith(b'#'):
+                break
+            dataStart += len(line)
+            words = line[1:].translate(None, b'()').split()
+            # `# Probe i (x y z)`, the column header line `# Probe 0 1 ...` has no coordinates
+            if len(words) == 5 and words[0] == b'Probe':
+                locations.append([float(w) for w in words[2:]])
+    return np.array(locations, dtype=float).reshape(-1, 3), dataStart
+#
+# Parse the data lines of a probe file
+#
+_probeBrackets = bytes.maketrans(b'()', b'  ')
+
+def parseFoamProbeData(raw, chunkSize=2**26):
+    '''
+        This function converts complete data lines of a probe file to a numpy array. Brackets of
+        vector and tensor probes are blanked with a byte translation and the numbers are parsed by
+        numpy in chunks of about `chunkSize` bytes, cut at line ends
+    INPUT
+        raw:        [bytes] Data lines, ending with a newline
+        chunkSize:  [integer] Approximate number of bytes parsed at once
+    OUTPUT
+        dataout:    [numpy array] (time steps x columns) array, time in the first column
+    '''
+    if not raw.strip():
+        return np.empty((0, 0))
+    firstLine = raw[:raw.find(b'\n')+1 or len(raw)]
+    numColumns = len(firstLine.translate(None, b'()').split())
+    blocks = []
+    start = 0
+    while start < len(raw):
+        stop = raw.find(b'\n', min(start+chunkSize, len(raw)-1))
+        stop = len(raw) if stop < 0 else stop+1
+        text = raw[start:stop].translate(_probeBrackets).decode('ascii')
+        blocks.append(np.fromstring(text, dtype=float, sep=' '))
+        start = stop
+    values = np.concatenate(blocks)
+    if values.size % numColumns:
+        sys.exit("\033[1;31;47mError: Probe data does not have %d columns on every line...\033[0m" % (numColumns))
+    return values.reshape(-1, numColumns)
+#
+# Function to read the probes
+#
+def readFoamProbes(filename,numProbes=None,fieldName='scalar',useCache=True,returnLocations=False):
+    '''
+        This function reads the OpenFOAM generated probes as numpy arrays. The number of probes and
+        their locations are taken from the file header. The parsed data is cached next to the source
+        (`filename`.npz) and reused as long as the size and modification time of the probe file do
+        not change, so appending solver output invalidates the cache
+    INPUT
+        filename:       [string] Name and location of the file containing the data
+        numProbes:      [integer] Number of points sampled in the domain, optional and only checked against the header
+        fieldname:      [string] Scalar or vector quantity to be read (vector also reads symmTensor and tensor probes)
+        useCache:       [boolean] Read and write the `.npz` cache next to the probe file
+        returnLocations:[boolean] Also return the probe locations
+    OUTPUT
+        dataout:        [numpy array] Returns a numpy array for the `fieldName`, time in the first column
+        locations:      [numpy array] (probes x 3) probe locations, only if `returnLocations`
+    '''
+    if fieldName not in ('scalar', 'vector'):
         sys.exit("\033[1;31;47mError: Unknown field type `%s` | Valid field type: scalar or vector...\033[0m" % (fieldName))
+    status = os.stat(filename)
+    cacheFile = filename+'.npz'
+    dataout = None
+    if useCache and os.path.isfile(cacheFile):
+        with np.load(cacheFile) as cache:
+            if cache['mtime_ns'] == status.st_mtime_ns and cache['size'] == status.st_size:
+                dataout, locations = cache['data'], cache['locations']
+    if dataout is None:
+        locations, dataStart = readFoamProbeHeader(filename)
+        with open(filename, 'rb') as file:
+            file.seek(dataStart)
+            raw = file.read()
+        # A line the solver is still writing is left for the next call
+        raw = raw[:raw.rfind(b'\n')+1]
+        dataout = parseFoamProbeData(raw)
+        if useCache:
+            np.savez(cacheFile+'.part.npz', data=dataout, locations=locations,
+                     mtime_ns=status.st_mtime_ns, size=status.st_size)
+            os.replace(cacheFile+'.part.npz', cacheFile)
+    if numProbes is not None and len(locations) and numProbes != len(locations):
+        print(f"Warning: {filename} has {len(locations)} probes in its header, not {numProbes}")
+    if returnLocations:
+        return dataout, locations
+    return dataout
+#
+# Follow a probe file of a running case
+#
+class FoamProbeReader:
+    '''
+        Stateful reader of an OpenFOAM probe file that is still being written. Every call to
+        `update` reads only the bytes appended since the previous call, parses the complete
+        lines and appends them to a preallocated array that grows by doubling, so polling a
+        large probe file only costs the new data. A line the solver is still writing is kept
+        until it is complete. If the file is truncated (e.g. the case was restarted) the
+        reader starts again from the header
+    INPUT
+        filename:       [string] Name and location of the probe file
+        initialRows:    [integer] Number of time steps allocated up front
+    '''
+    def __init__(self, filename, initialRows=1024):
+        self.filename = filename
+        self.initialRows = initialRows
+        self.reset()
 
+    def reset(self):
+        '''
+            Forget all data read so far, the next `update` reads the file from the start
+        '''
+        self.locations = np.empty((0, 3))
+        self.offset = None
+        self.partial = b''
+        self.numRows = 0
+        self._buffer = None
 
-    return dataout
+    @property
+    def data(self):
+        '''
+            (time steps x columns) view of the data read so far, time in the first column
+        '''
+        if self._buffer is None:
+            return np.empty((0, 0))
+        return self._buffer[:self.numRows]
+
+    def _append(self, rows):
+        if self._buffer is None:
+            self._buffer = np.empty((max(self.initialRows, len(rows)), rows.shape[1]))
+        elif self._buffer.shape[1] != rows.shape[1]:
+            sys.exit("\033[1;31;47mError: Number of columns of `%s` changed from %d to %d...\033[0m"
+                     % (self.filename, self._buffer.shape[1], rows.shape[1]))
+        if self.numRows+len(rows) > len(self._buffer):
+            grown = np.empty((max(2*len(self._buffer), self.numRows+len(rows)), self._buffer.shape[1]))
+            grown[:self.numRows] = self._buffer[:self.numRows]
+            self._buffer = grown
+        self._buffer[self.numRows:self.numRows+len(rows)] = rows
+        self.numRows += len(rows)
+
+    def update(self):
+        '''
+            Read the lines appended since the last call
+        OUTPUT
+            newRows:    [numpy array] View of the time steps added by this call
+        '''
+        if not os.path.isfile(self.filename):
+            return self.data[self.numRows:]
+        size = os.path.getsize(self.filename)
+        if self.offset is not None and size < self.offset:
+            self.reset()
+        if self.offset is None:
+            locations, dataStart = readFoamProbeHeader(self.filename)
+            # Wait until the header is complete, i.e. the first data line has started
+            if dataStart >= size:
+                return self.data[self.numRows:]
+            self.locations, self.offset = locations, dataStart
+        with open(self.filename, 'rb') as file:
+            file.seek(self.offset)
+            raw = self.partial+file.read(size-self.offset)
+        self.offset = size
+        lastNewline = raw.rfind(b'\n')+1
+        self.partial = raw[lastNewline:]
+        start = self.numRows
+        rows = parseFoamProbeData(raw[:lastNewline])
+        if len(rows):
+            self._append(rows)
+        return self.data[start:]
+#
+# Parse the residuals of an OpenFOAM log file
+#
+residualDtype = np.dtype([('step', np.int32), ('field', np.int16), ('initial', np.float64),
+                          ('final', np.float64), ('iterations', np.int32)])
+_logPattern = re.compile(rb'^Time = ([^\s]+?)s?\s*$|Solving for ([\w.]+), Initial residual = ([^,\s]+), '
+                         rb'Final residual = ([^,\s]+), No Iterations (\d+)', re.MULTILINE)
+
+def parseFoamLogText(text, times, fields, records):
+    '''
+        This function appends the time steps and linear solves found in a piece of an OpenFOAM log
+        to the given lists, so that a log can also be parsed in pieces as it grows
+    INPUT
+        text:       [bytes] Complete lines of the log
+        times:      [list] Times found so far, extended in place
+        fields:     [dictionary] Field name -> field index found so far, extended in place
+        records:    [list] Records (see `residualDtype`) found so far, extended in place
+    '''
+    for match in _logPattern.finditer(text):
+        if match.group(1) is not None:
+            times.append(float(match.group(1)))
+        else:
+            field = fields.setdefault(match.group(2).decode(), len(fields))
+            records.append((len(times)-1, field, float(match.group(3)), float(match.group(4)), int(match.group(5))))
+
+def parseFoamLog(filename):
+    '''
+        This function extracts all "Solving for X" lines of an OpenFOAM log in a single pass
+    INPUT
+        filename:   [string] Name and location of the log file
+    OUTPUT
+        times:      [numpy array] Time of every time step (iteration) of the log
+        fields:     [list] Names of the solved fields, in order of first appearance
+        residuals:  [numpy array] Structured array (`residualDtype`) with one record per linear solve:
+                    time step index, field index into `fields`, initial and final residual and the
+                    number of iterations. Solves before the first `Time =` line get step -1
+    '''
+    with open(filename, 'rb') as file:
+        text = file.read()
+    times, fields, records = [], {}, []
+    parseFoamLogText(text, times, fields, records)
+    return np.array(times, dtype=float), list(fields), np.array(records, dtype=residualDtype)
+#
+# Save and load the residuals of one case
+#
+def saveResiduals(filename, times, fields, residuals):
+    '''
+        This function writes the output of `parseFoamLog` to a single compressed `.npz` file
+    INPUT
+        filename:   [string] Output file
+        times, fields, residuals: see `parseFoamLog`
+    '''
+    np.savez_compressed(filename, times=times, fields=np.array(fields, dtype=str), residuals=residuals)
+
+def loadResiduals(filename):
+    '''
+        This function reads a file written by `saveResiduals`
+    OUTPUT
+        times, fields, residuals: see `parseFoamLog`
+    '''
+    with np.load(filename) as data:
+        return data['times'], list(data['fields']), data['residuals']
+#
+# Residual history of one field
+#
+def residualSeries(fields, residuals, fieldName, after=None, quantity='initial'):
+    '''
+        This function returns the residuals of one field in the order they were solved
+    INPUT
+        fields, residuals: see `parseFoamLog`
+        fieldName:  [string] Name of the field (e.g. 'Ux', 'p', 'k')
+        after:      [string] Only keep the solves directly following a solve of this field, e.g. the
+                    first pressure solve of every iteration is residualSeries(fields, residuals, 'p', after='Uz')
+        quantity:   [string] 'initial', 'final' or 'iterations'
+    OUTPUT
+        series:     [numpy array] Selected values
+    '''
+    if fieldName not in fields:
+        return np.empty(0, dtype=residuals.dtype[quantity])
+    selected = residuals['field'] == fields.index(fieldName)
+    if after is not None:
+        previous = np.zeros(len(residuals), dtype=bool)
+        if after in fields:
+            previous[1:] = residuals['field'][:-1] == fields.index(after)
+        selected &= previous
+    return residuals[quantity][selected]
 #
 # Read an obj
 #
+ObjMesh = namedtuple('ObjMesh', ['vertices', 'faces', 'groups', 'group_start'])
+
+def _parse_obj_chunk(chunk, vertex_base):
+    '''
+        This function parses complete lines of an OBJ file. Every line is classified from its first two
+        bytes, the bytes of all `v` lines and of all `f` lines are gathered with a mask and parsed in one
+        call each, so no Python code runs per line. Per byte of the chunk only boolean and int8 masks are
+        allocated, the integer positions are kept per line or per token
+    INPUT
+        chunk:          [bytes] Complete lines of the OBJ file
+        vertex_base:    [integer] Number of vertices defined before the chunk
+    OUTPUT
+        vertices:       [numpy array] (vertices x 3) coordinates
+        triangles:      [numpy array] (triangles x 3) zero based vertex indices (polygons are fan triangulated)
+        groups:         [list] (name, first triangle in the chunk) of the `g`/`o` records
+    '''
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    ends = np.flatnonzero(data == ord('\n'))
+    starts = np.concatenate([[0], ends[:-1]+1])
+    lengths = ends-starts+1
+    first = data[starts]
+    second = np.where(lengths > 1, data[np.minimum(starts+1, len(data)-1)], ord('\n'))
+    blank = (second == ord(' ')) | (second == ord('\t'))
+    is_vertex = (first == ord('v')) & blank
+    is_face = (first == ord('f')) & blank
+    is_group = ((first == ord('g')) | (first == ord('o'))) & blank
+    whitespace = (data == ord(' ')) | (data == ord('\t')) | (data == ord('\n')) | (data == ord('\r'))
+    # Vertices
+    vertices = np.empty((0, 3))
+    if np.any(is_vertex):
+        text = data[np.repeat(is_vertex, lengths)].tobytes().translate(None, b'v')
+        values = np.fromstring(text.decode('ascii'), dtype=float, sep=' ')
+        nvertices = np.count_nonzero(is_vertex)
+        if values.size % nvertices:
+            # Mixed records, e.g. some vertices with colours
+            values = np.array([line.split()[:3] for line in text.splitlines()], dtype=float)
+        vertices = values.reshape(nvertices, -1)[:, :3]
+    # Faces, only the vertex index of v/vt/vn is kept
+    triangles = np.empty((0, 3), dtype=np.int64)
+    counts = np.zeros(len(starts), dtype=np.int64)
+    if np.any(is_face):
+        face_bytes = np.repeat(is_face, lengths)
+        token_start = ~whitespace & np.concatenate([[True], whitespace[:-1]])
+        counts[is_face] = np.add.reduceat(token_start, starts)[is_face]-1
+        keep = face_bytes.copy()
+        slash = np.flatnonzero((data == ord('/')) & face_bytes)
+        if len(slash):
+            # Drop every token from its first slash to its end, located from the token boundaries
+            # (one index per token instead of one per byte)
+            token_starts = np.flatnonzero(token_start)
+            token_ends = np.flatnonzero(~whitespace & np.concatenate([whitespace[1:], [True]]))
+            token = np.searchsorted(token_starts, slash, side='right')-1
+            first_slash = np.concatenate([[True], token[1:] != token[:-1]])
+            drop = np.zeros(len(data)+1, dtype=np.int8)
+            drop[slash[first_slash]] = 1
+            drop[token_ends[token[first_slash]]+1] = -1
+            keep &= np.cumsum(drop[:-1], dtype=np.int8) == 0
+        text = data[keep].tobytes().translate(None, b'f')
+        index = np.fromstring(text.decode('ascii'), dtype=np.int64, sep=' ')
+        face_counts = counts[is_face]
+        if np.any(index < 0):
+            # Negative indices count back from the last vertex defined before the face
+            defined = np.repeat((vertex_base+np.cumsum(is_vertex))[is_face], face_counts)
+            index = np.where(index < 0, defined+index+1, index)
+        index -= 1
+        # Fan triangulation of the polygons
+        offset = np.cumsum(face_counts)-face_counts
+        ntriangles = np.maximum(face_counts-2, 0)
+        fan = np.repeat(offset, ntriangles)
+        corner = np.arange(ntriangles.sum())-np.repeat(np.cumsum(ntriangles)-ntriangles, ntriangles)+1
+        triangles = np.column_stack([index[fan], index[fan+corner], index[fan+corner+1]])
+    # Groups start at the number of triangles written before them
+    triangles_before = np.cumsum(np.maximum(counts-2, 0))-np.maximum(counts-2, 0)
+    groups = []
+    for line in np.flatnonzero(is_group):
+        words = chunk[starts[line]:ends[line]].split(None, 1)
+        groups.append((words[1].strip().decode() if len(words) > 1 else '', int(triangles_before[line])))
+    return vertices, triangles, groups
+
+def read_obj(file_path, use_cache=True, chunk_size=2**24):
+    '''
+        This function reads the vertices, faces and groups of an OBJ file. The file is parsed in chunks of
+        about `chunk_size` bytes cut at line ends (see `_parse_obj_chunk`). Faces may use the v, v/vt, v//vn
+        and v/vt/vn syntax and negative indices, polygons are fan triangulated. The result is cached in
+        `file_path`.npz and reused while the size and modification time of the OBJ file do not change
+    INPUT
+        file_path:      [string] Name and location of the OBJ file
+        use_cache:      [boolean] Read and write the `.npz` cache next to the OBJ file
+        chunk_size:     [integer] Approximate number of bytes parsed at once, the parser needs about
+                        12 bytes of temporary memory per byte of the chunk (~200 MB for the default)
+    OUTPUT
+        mesh:           [ObjMesh] vertices (vertices x 3), faces (triangles x 3, zero based),
+                        groups (names of the `g`/`o` records) and group_start (first triangle of every group)
+    '''
+    status = os.stat(file_path)
+    cache_file = file_path+'.npz'
+    if use_cache and os.path.isfile(cache_file):
+        with np.load(cache_file) as cache:
+            if cache['mtime_ns'] == status.st_mtime_ns and cache['size'] == status.st_size:
+                return ObjMesh(cache['vertices'], cache['faces'], [str(name) for name in cache['groups']], cache['group_start'])
+    vertices, faces, groups, group_start = [], [], [], []
+    nvertices, nfaces = 0, 0
+    with open(file_path, 'rb') as file:
+        remainder = b''
+        while True:
+            block = file.read(chunk_size)
+            chunk = remainder+block
+            cut = chunk.rfind(b'\n')+1 if block else len(chunk)
+            chunk, remainder = chunk[:cut], chunk[cut:]
+            if chunk and not chunk.endswith(b'\n'):
+                chunk += b'\n'
+            if chunk:
+                chunk_vertices, chunk_triangles, chunk_groups = _parse_obj_chunk(chunk, nvertices)
+                vertices.append(chunk_vertices)
+                faces.append(chunk_triangles)
+                for name, start in chunk_groups:
+                    groups.append(name)
+                    group_start.append(nfaces+start)
+                nvertices += len(chunk_vertices)
+                nfaces += len(chunk_triangles)
+            if not block:
+                break
+    mesh = ObjMesh(np.concatenate(vertices) if vertices else np.empty((0, 3)),
+                   np.concatenate(faces) if faces else np.empty((0, 3), dtype=np.int64),
+                   groups, np.array(group_start, dtype=np.int64))
+    if use_cache:
+        np.savez(cache_file+'.part.npz', vertices=mesh.vertices, faces=mesh.faces, groups=np.array(groups, dtype=str),
+                 group_start=mesh.group_start, mtime_ns=status.st_mtime_ns, size=status.st_size)
+        os.replace(cache_file+'.part.npz', cache_file)
+    return mesh
+
 def load_obj1(file_path):
-    vertices = []
-    faces = []
-
-    with open(file_path, 'r') as f:
-        for line in f:
-            parts = line.split()
-            if not parts:
-                continue
-
-            if parts[0] == 'v':
-                vertices.append([float(parts[1]), float(parts[2]), float(parts[3])])
-            elif parts[0] == 'f':
-                face = [int(x.split('/')[0]) - 1 for x in parts[1:]]
-                faces.append(face)
-
-    return np.array(vertices), np.array(faces)
+    '''
+        This function returns the vertices and the faces of an OBJ file, see `read_obj`. Quads and other
+        polygons are returned fan triangulated, i.e. faces is always (triangles x 3) and a polygon with
+        n vertices gives n-2 rows, unlike earlier versions that returned the polygons themselves
+    '''
+    mesh = read_obj(file_path)
+    return mesh.vertices, mesh.faces
+#
+# Memory-mapped stack of the per-direction binary files
+#
+class DirectionStack:
+    '''
+        Expose the per-direction binary files `{file_prefix}_{theta}.bin` as one
+        (directions x points) array without reading them. Every file is memory-mapped
+        and data is only paged in when a row or a point range is sliced, e.g.
+        stack[i], stack[:, start:stop] or stack[i, mask]. Compressed files
+        (`{file_prefix}_{theta}.bin.zlib`) are decoded one row at a time instead.
+    INPUT
+        file_prefix:    [string] Prefix of the binary files (e.g. 'data/Umag_2')
+        directions:     [array like] Wind directions to expose, in row order
+        dtype:          [numpy dtype] Data type of the binary files
+        compression:    [string] None, 'zlib' or 'quantize' (see `decode_plane`)
+        scale:          [float] Quantisation step of the 'quantize' compression
+    '''
+    ndim = 2
+
+    def __init__(self, file_prefix, directions, dtype=np.float64, compression=None, scale=None):
+        self.directions = np.asarray(directions)
+        self.dtype = np.dtype(dtype)
+        self.compression = compression
+        self.scale = scale
+        self._cached_row = (None, None)
+        if compression is None:
+            self.filenames = [f'{file_prefix}_{int(theta)}.bin' for theta in self.directions]
+            self._rows = [np.memmap(filename, dtype=self.dtype, mode='r') for filename in self.filenames]
+            row_sizes = np.array([len(row) for row in self._rows])
+            if not np.all(row_sizes == row_sizes[0]):
+                bad = self.filenames[np.argmax(row_sizes != row_sizes[0])]
+                raise ValueError(f"{bad} has {row_sizes[row_sizes != row_sizes[0]][0]} points, expected {row_sizes[0]}")
+            self.shape = (len(self._rows), int(row_sizes[0]))
+        else:
+            self.filenames = [f'{file_prefix}_{int(theta)}.bin.zlib' for theta in self.directions]
+            missing = [filename for filename in self.filenames if not os.path.isfile(filename)]
+            if missing:
+                raise FileNotFoundError(f"{missing[0]} (and {len(missing)-1} more) not found")
+            self.shape = (len(self.filenames), len(self._row(0)))
+
+    def _row(self, row):
+        if self.compression is None:
+            return self._rows[row]
+        # Keep the last decoded row, rows are typically read in consecutive point ranges
+        if self._cached_row[0] != row:
+            with open(self.filenames[row], 'rb') as f:
+                self._cached_row = (row, decode_plane(f.read(), self.dtype, self.compression, self.scale))
+        return self._cached_row[1]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        row_key = key[0]
+        point_key = key[1] if len(key) > 1 else slice(None)
+        if isinstance(row_key, (int, np.integer)):
+            return self._row(row_key)[point_key]
+        rows = np.arange(self.shape[0])[row_key]
+        return np.stack([self._row(row)[point_key] for row in rows])
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:, :]
+        return data if dtype is None else data.astype(dtype)
+
+    def signature(self):
+        '''
+            Data type, compression, directions and size and modification time of every file,
+            a consolidated stack with another signature is out of date
+        '''
+        return {'dtype': self.dtype.name, 'compression': self.compression, 'scale': self.scale,
+                'directions': [int(theta) for theta in self.directions],
+                'files': [[os.stat(filename).st_size, os.stat(filename).st_mtime_ns] for filename in self.filenames]}
+
+    def consolidate(self, filename):
+        '''
+            Write the stack to a single (directions x points) `.npy` file, one direction
+            at a time so that resident memory stays at one row. The file is written to
+            `filename`.part first and its signature to `filename`.json afterwards, so an
+            interrupted run never leaves a stack that looks complete
+        INPUT
+            filename:   [string] Name of the consolidated `.npy` file
+        OUTPUT
+            None
+        '''
+        signature_filename = filename+'.json'
+        if os.path.isfile(signature_filename):
+            os.remove(signature_filename)
+        temporary_filename = filename+'.part'
+        stacked = np.lib.format.open_memmap(temporary_filename, mode='w+', dtype=self.dtype, shape=self.shape)
+        for row in range(self.shape[0]):
+            stacked[row, :] = self._row(row)
+        stacked.flush()
+        del stacked
+        os.replace(temporary_filename, filename)
+        with open(signature_filename+'.part', 'w') as f:
+            json.dump(self.signature(), f)
+        os.replace(signature_filename+'.part', signature_filename)
+
+    def is_consolidated(self, filename):
+        '''
+            True if `filename` was consolidated from the current per-direction files
+        '''
+        if not os.path.isfile(filename) or not os.path.isfile(filename+'.json'):
+            return False
+        with open(filename+'.json', 'r') as f:
+            return json.load(f) == self.signature()
+#
+# Decode a compressed plane
+#
+def decode_plane(raw, dtype=np.float32, compression='zlib', scale=None):
+    '''
+        This function decodes the content of a file written by `conversion_functions.save_to_compressed`
+    INPUT
+        raw:            [bytes] Content of the compressed file
+        dtype:          [numpy dtype] Data type of the decoded values
+        compression:    [string] 'zlib' or 'quantize'
+        scale:          [float] Quantisation step of the 'quantize' compression
+    OUTPUT
+        data:           [numpy array] Decoded values
+    '''
+    raw = zlib.decompress(raw)
+    if compression == 'quantize':
+        return (np.frombuffer(raw, dtype=np.int32)*scale).astype(dtype)
+    return np.frombuffer(raw, dtype=dtype)
+#
+# Find the JSON index describing a set of per-direction binary files
+#
+def find_plane_index(file_prefix):
+    '''
+        This function returns the JSON index (data/plane_{z}.json) of the height of `file_prefix`
+        (e.g. 'data/Umag_2'), or None for data converted before the index existed. The recorded
+        'format' tells whether the data is in per-direction files `{variable}_{z}_{theta}.bin` ('bin')
+        or in one (directions x points) stack `plane_{z}_{variable}.npy` ('stack')
+    '''
+    directory, name = os.path.split(file_prefix)
+    height = name.rsplit('_', 1)[-1]
+    index_filename = os.path.join(directory, 'plane_'+height+'.json')
+    if not os.path.isfile(index_filename):
+        return None
+    with open(index_filename, 'r') as f:
+        return json.load(f)
+#
+# Load the per-direction simulation data as a memory-mapped stack
+#
+def load_direction_stack(file_prefix, directions, dtype=None, stacked_filename=None):
+    '''
+        This function returns a (directions x points) memory-mapped view of the simulation data
+    INPUT
+        file_prefix:        [string] Prefix of the per-direction binary files (e.g. 'data/Umag_2')
+        directions:         [array like] Wind directions to load, in row order
+        dtype:              [numpy dtype] Data type of the binary files. By default the data type and
+                            compression are taken from the JSON index of the conversion (float64 without it)
+        stacked_filename:   [string] Optional consolidated `.npy` file. It is written from the
+                            per-direction files and memory-mapped afterwards, it is rebuilt when the
+                            directions, data type or any per-direction file changed (see
+                            `DirectionStack.signature`). Not used when the data was converted with
+                            the 'stack' format, which is already consolidated
+    OUTPUT
+        stack:              [DirectionStack or numpy memmap] Lazily loaded (directions x points) data
+    '''
+    compression, scale = None, None
+    index = find_plane_index(file_prefix)
+    if index is not None and index['format'] == 'stack':
+        return select_stack_directions(index, file_prefix, directions)
+    if dtype is None:
+        if index is None:
+            dtype = np.float64
+        else:
+            dtype, compression, scale = index['dtype'], index.get('compression'), index.get('scale')
+    stack = DirectionStack(file_prefix, directions, dtype, compression, scale)
+    if stacked_filename is None:
+        return stack
+    if not stack.is_consolidated(stacked_filename):
+        print(f"*** Writing consolidated direction stack {stacked_filename} ***")
+        stack.consolidate(stacked_filename)
+    return np.load(stacked_filename, mmap_mode='r')
+#
+# Select the directions of a consolidated stack
+#
+def select_stack_directions(index, file_prefix, directions):
+    '''
+        This function memory-maps the (directions x points) stack of the variable of `file_prefix`
+        written with the 'stack' format and returns the rows of `directions`. Directions with a
+        constant step in the stack are a view, other selections are read into memory
+    INPUT
+        index:          [dictionary] Content of the JSON index of the height (see `find_plane_index`)
+        file_prefix:    [string] Prefix of the variable and height (e.g. 'data/Umag_2')
+        directions:     [array like] Wind directions to load, in row order
+    OUTPUT
+        stack:          [numpy memmap or numpy array] (directions x points) data
+    '''
+    directory, name = os.path.split(file_prefix)
+    variable = name.rsplit('_', 1)[0]
+    if 'completed' in index and not np.all(np.load(os.path.join(directory, index['completed']))):
+        print(f"WARNING: {file_prefix} has directions that were not converted yet")
+    stack = np.load(os.path.join(directory, index['variables'][variable]), mmap_mode='r')
+    missing = [int(wd) for wd in directions if int(wd) not in index['directions']]
+    if missing:
+        raise ValueError(f"Directions {missing} are not in the stack of {file_prefix}")
+    rows = np.array([index['directions'].index(int(wd)) for wd in directions])
+    steps = np.diff(rows)
+    if len(rows) == 1 or (steps[0] > 0 and np.all(steps == steps[0])):
+        step = 1 if len(rows) == 1 else int(steps[0])
+        return stack[rows[0]:rows[-1]+1:step]
+    return stack[rows]
+#
+# Open one variable of a converted plane through its JSON index
+#
+def open_plane(index_filename, variable='Umag'):
+    '''
+        This function opens one variable of a converted height through the JSON index written by
+        `conversion_functions.convert_planes` (data/plane_{z}.json). Both the per-angle binary files and
+        the consolidated (directions x points) stack are returned as a memory-mapped 2D view, so a point
+        range can be sliced across all directions without reading the rest
+    INPUT
+        index_filename: [string] Name and location of the JSON index
+        variable:       [string] Name of the variable ('Umag' or 'TKE')
+    OUTPUT
+        stack:          [DirectionStack or numpy memmap] (directions x points) data
+        index:          [dictionary] Content of the JSON index (directions, dtype, coordinates, mask...)
+    '''
+    with open(index_filename, 'r') as f:
+        index = json.load(f)
+    directory = os.path.dirname(index_filename)
+    if index['format'] == 'stack':
+        if 'completed' in index and not np.all(np.load(os.path.join(directory, index['completed']))):
+            print(f"WARNING: {index_filename} has directions that were not converted yet")
+        stack = np.load(os.path.join(directory, index['variables'][variable]), mmap_mode='r')
+    else:
+        file_prefix = os.path.join(directory, index['variables'][variable].split('_{wd}')[0])
+        stack = DirectionStack(file_prefix, index['directions'], dtype=index['dtype'],
+                               compression=index.get('compression'), scale=index.get('scale'))
+    return stack, index
+#
+# Load the coordinates of a converted plane
+#
+def load_plane_coordinates(index_filename):
+    '''
+        This function returns the x and y coordinates of a converted height described by its JSON index
+    '''
+    with open(index_filename, 'r') as f:
+        index = json.load(f)
+    directory = os.path.dirname(index_filename)
+    coordinates = index['coordinates']
+    x = np.fromfile(os.path.join(directory, coordinates['x']), dtype=coordinates['dtype'])
+    y = np.fromfile(os.path.join(directory, coordinates['y']), dtype=coordinates['dtype'])
+    return x, y
+#
+# Count the risk exceedances for all (alpha, beta) pairs in a single pass
+#
+def risk_exceedance_counts(U_stack, tke_stack, alphas, betas, Uref, point_range=None, point_chunk=262144):
+    '''
+        This function reads every direction of U and TKE once and counts, for all (alpha, beta)
+        pairs at once, the number of directions for which
+            risk:       U > alpha*Uref and TKE > beta*Uref^2
+            tke_risk:   TKE > beta*Uref^2
+    INPUT
+        U_stack:        [array like] (directions x points) velocity magnitude, e.g. from `load_direction_stack`
+        tke_stack:      [array like] (directions x points) turbulent kinetic energy
+        alphas:         [list] Velocity thresholds as a fraction of Uref
+        betas:          [list] TKE thresholds as a fraction of Uref^2
+        Uref:           [float] Reference velocity (m/s)
+        point_range:    [tuple] Optional (start, stop) range of points to process (default all points)
+        point_chunk:    [integer] Number of points processed at once, bounds the temporary memory
+    OUTPUT
+        risk_count:     [numpy array] (alphas x betas x points) number of directions at risk
+        tke_count:      [numpy array] (betas x points) number of directions with TKE risk
+    '''
+    number_of_directions, number_of_points = U_stack.shape
+    start, stop = (0, number_of_points) if point_range is None else point_range
+    count_dtype = np.uint16 if number_of_directions <= np.iinfo(np.uint16).max else np.uint32
+    U_thresholds = np.asarray(alphas, dtype=np.float64)[:, None]*Uref
+    tke_thresholds = np.asarray(betas, dtype=np.float64)[:, None]*Uref*Uref
+    risk_count = np.zeros((len(alphas), len(betas), stop-start), dtype=count_dtype)
+    tke_count = np.zeros((len(betas), stop-start), dtype=count_dtype)
+    for direction in range(number_of_directions):
+        for chunk_start in range(start, stop, point_chunk):
+            chunk_end = min(chunk_start+point_chunk, stop)
+            local = slice(chunk_start-start, chunk_end-start)
+            U = U_stack[direction, chunk_start:chunk_end]
+            tke = tke_stack[direction, chunk_start:chunk_end]
+            U_exceeds = U[None, :] > U_thresholds
+            tke_exceeds = tke[None, :] > tke_thresholds
+            risk_count[:, :, local] += U_exceeds[:, None, :] & tke_exceeds[None, :, :]
+            tke_count[:, local] += tke_exceeds
+    return risk_count, tke_count
 #
 # Set default plotting size
 #
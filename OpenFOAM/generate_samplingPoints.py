@@ -1,15 +1,21 @@
-from functions import generate_uniform_points, load_obj, plot_mesh_and_points, fixPlot
+from functions import generate_uniform_points, generate_points_outside_mesh, load_obj, plot_mesh_and_points, fixPlot
 import numpy as np
 #
 # User input data
 #
 visualisePoints=True            # Plot the points along with the geometry
+plotOffscreen=False             # Only save the plot to samplingPoints.png, no window (e.g. on a login node)
+maxPlotFaces = 20000            # Mesh is decimated to this many triangles for plotting (None: full mesh)
 printPoints=True                # Print the points to screen
 savePoints2File=False           # Save the points to a file
 ximin = [389,315,0.2]           # Minimum coordinate in x, y, and z
 ximax = [415,858,108]           # Maximum coordinate in x, y, and z
 bf = 1                          # Boundary scaling factor (bf > 1 larger domain sampling in x and y)
 numberOfPoints = 200            # Number of points in total
+samplingMethod = 'uniform'      # 'uniform', 'stratified', 'sobol' or 'halton'
+seed = 42                       # Seed of the sampling, the same seed reproduces the same points
+avoidBuildings = True           # Discard points inside the buildings of the OBJ file
+clearance = 1.0                 # Minimum distance of the points to the buildings (used with avoidBuildings)
 obj_file_path = '../nominal/geo/Mesh_Buildings.obj'  # Replace with the path to your OBJ file
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
 #       Do not touch beyond this line unless you are absolutely sure of what              #
@@ -22,14 +28,19 @@ z_min, z_max = ximin[2], ximax[2]
 # Save Points to file after generation
 if(savePoints2File):
 	print("Points will be saved to file")
-	samplingPoints = generate_uniform_points(x_min,x_max,y_min,y_max,z_min,z_max,numberOfPoints,savePoints2File)
+	if(avoidBuildings):
+		samplingPoints = generate_points_outside_mesh(x_min,x_max,y_min,y_max,z_min,z_max,numberOfPoints,load_obj(obj_file_path),
+		                                              clearance,savePoints2File,seed=seed,method=samplingMethod)
+	else:
+		samplingPoints = generate_uniform_points(x_min,x_max,y_min,y_max,z_min,z_max,numberOfPoints,savePoints2File,
+		                                         seed=seed,method=samplingMethod)
 else:
 	samplingPoints = np.loadtxt('points.csv',skiprows=1)
 # Plot the points to visualise
 if(visualisePoints):
     mesh = load_obj(obj_file_path)
     fixPlot(thickness=1.5, fontsize=20, markersize=8, labelsize=15, texuse=True, tickSize = 10)
-    plot_mesh_and_points(mesh=mesh,points=samplingPoints)
+    plot_mesh_and_points(mesh=mesh,points=samplingPoints,max_faces=maxPlotFaces,offscreen=plotOffscreen)
 # Print all the points to screen
 if(printPoints):
 	# Print to screen points
@@ -0,0 +1,49 @@
+import os
+import time
+import numpy as np
+import multiprocessing as mp
+from functions import parseFoamLog, saveResiduals, residualSeries
+
+def extract_residuals(args):
+    '''
+        Parse one log file and write all its residuals to `{outdir}/res_{outfileprefix}.npz`.
+        Optionally also write the per-field text files of `getlogdata` in functions.sh.
+    '''
+    logfile, outfileprefix, outdir, export_text = args
+    if not os.path.isfile(logfile):
+        return logfile, 0, "missing log file"
+    times, fields, residuals = parseFoamLog(logfile)
+    saveResiduals(os.path.join(outdir, f'res_{outfileprefix}.npz'), times, fields, residuals)
+    if export_text:
+        # Same series as getlogdata: the pressure is the solve directly after Uz
+        for field in ('p', 'Ux', 'Uy', 'Uz', 'k', 'omega', 'epsilon'):
+            series = residualSeries(fields, residuals, field, after='Uz' if field == 'p' else None)
+            np.savetxt(os.path.join(outdir, f'res_{field}_{outfileprefix}'), series, fmt='%g')
+    return logfile, len(times), ''
+
+
+if __name__ == '__main__':
+
+    # USER INPUT
+    turbClosure = ["kOmegaSST", "kEpsilon"]                                                # Name of all the turbulence closures
+    retauarray = ["200", "400", "600", "800", "1000", "1500", "2000", "2500", "3000", "5000"]
+    outdir = 'residuals'
+    export_text = False                     # Also write the res_{field}_{case} text files of getResiduals.sh
+    n_processes = None                      # Number of parallel processes (None uses all available cores)
+
+    # One task per log file
+    tasks = [(f'logs/{closure}_run_{retau}.log', f'{retau}{closure}', outdir, export_text)
+             for closure in turbClosure for retau in retauarray]
+    print(f"The script loops over {len(turbClosure)} closure models and {len(retauarray)} cases...")
+    os.makedirs(outdir, exist_ok=True)
+
+    # Every log is read once, the logs are spread over the cores
+    simStartTime = time.time()
+    with mp.Pool(processes=n_processes) as pool:
+        for logfile, nsteps, message in pool.imap_unordered(extract_residuals, tasks):
+            if message:
+                print(f"Skipped file -- {logfile} ({message})")
+            else:
+                print(f"Done with file -- {logfile} ({nsteps} iterations)")
+    print(f"Script finished in {time.time()-simStartTime:.1f} seconds...")
+    print("-------------------------------------------")
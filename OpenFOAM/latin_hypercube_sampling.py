@@ -2,22 +2,18 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy.interpolate import interp1d
 from pyDOE import lhs
+from wind_climate import WindClimate
 #
 # Load and process data
 #
 n_samples = 6  
 wind_datafilename = 'wind_data_pwc.txt'
-data = np.loadtxt(wind_datafilename)
-wind_speed = data[:,0]
-wind_direction = data[:,1]
-print(f"Historical Wind Dataframe size: {len(data)}")
+climate = WindClimate(wind_datafilename)
+print(f"Historical Wind Dataframe size: {len(climate)}")
 #
 # Histogram of wind direction
 #
-count, bins = np.histogram(wind_direction, bins=360, density=False)
-bin_center = 0.5 * (bins[:-1] + bins[1:])
-pdf = count / np.sum(count)
-cdf = np.cumsum(pdf)
+pdf, cdf, bin_center = climate.direction_pdf(bins=360)
 #
 # Interpolator to do inverse CDF sampling
 #
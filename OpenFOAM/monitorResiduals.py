@@ -0,0 +1,224 @@
+import os
+import re
+import glob
+import time
+import asyncio
+import numpy as np
+from collections import deque
+from functions import parseFoamLogText
+
+# Floor of the residuals before taking logarithms, fields that are solved out report exactly 0
+residualFloor = 1e-300
+
+def caseDirectory(logfile):
+    '''
+        Case directory of a log: the parent of its `logs` folder
+    '''
+    return os.path.dirname(os.path.dirname(os.path.abspath(logfile)))
+
+class LogMonitor:
+    '''
+        Follow one solver log: only the bytes appended since the last poll are parsed and the
+        initial residual of the first solve of every field per iteration is kept in a rolling window
+    INPUT
+        logfile:        [string] Log file, the case directory is the parent of its `logs` folder
+        window:         [integer] Number of iterations in the rolling window
+    '''
+    def __init__(self, logfile, window):
+        self.logfile = logfile
+        self.caseDir = caseDirectory(logfile)
+        self.controlDict = os.path.join(self.caseDir, 'system', 'controlDict')
+        self.window = window
+        self.offset = 0
+        self.partial = b''
+        self.times, self.fields = [], {}
+        self.history = {}
+        self.lastStep = {}
+        self.status = 'running'
+        self.finished = False
+        self.stopRequested = False
+        self.originalStopAt = None
+        self.superseded = False
+        # A log only counts as live when it grows after its history has been read
+        self.polls = 0
+        self.grew = False
+        self.lastGrowth = os.path.getmtime(logfile)
+
+    def poll(self):
+        '''
+            Parse the lines appended since the last call, returns the number of new iterations
+        '''
+        size = os.path.getsize(self.logfile)
+        if size < self.offset:
+            # The log was overwritten by a new run
+            self.__init__(self.logfile, self.window)
+        self.grew = self.polls > 0 and size > self.offset
+        self.polls += 1
+        if self.grew:
+            self.lastGrowth = time.time()
+        with open(self.logfile, 'rb') as file:
+            file.seek(self.offset)
+            raw = self.partial+file.read(size-self.offset)
+        self.offset = size
+        lastNewline = raw.rfind(b'\n')+1
+        self.partial = raw[lastNewline:]
+        nsteps = len(self.times)
+        records = []
+        parseFoamLogText(raw[:lastNewline], self.times, self.fields, records)
+        for step, field, initial, final, iterations in records:
+            # Keep the first solve of every field per iteration (e.g. the first pressure corrector)
+            if self.lastStep.get(field) == step:
+                continue
+            self.lastStep[field] = step
+            self.history.setdefault(field, deque(maxlen=self.window)).append(initial)
+        if re.search(rb'^End\s*$', raw, re.MULTILINE):
+            self.finished = True
+        return len(self.times)-nsteps
+
+    def statistics(self):
+        '''
+            Rolling statistics of every field: last, minimum and mean initial residual and the slope of
+            log10(residual) in decades per iteration over the window
+        '''
+        stats = {}
+        for name, field in self.fields.items():
+            values = np.array(self.history.get(field, ()))
+            if len(values) == 0:
+                continue
+            with np.errstate(divide='ignore', invalid='ignore'):
+                logValues = np.log10(np.maximum(values, residualFloor))
+            slope = np.polyfit(np.arange(len(values)), logValues, 1)[0] if len(values) > 1 and np.all(np.isfinite(logValues)) else np.nan
+            # Exact zeros (solved-out fields) do not set the minimum the divergence is measured from
+            positive = values[values > 0]
+            stats[name] = {'last': values[-1], 'min': positive.min() if len(positive) else 0.0, 'mean': values.mean(), 'slope': slope, 'samples': len(values)}
+        return stats
+
+    def classify(self, tolerance, plateauDecades, divergenceDecades):
+        '''
+            Set `status` to 'finished', 'converged' (all residuals below `tolerance`), 'diverged'
+            (non-finite residuals, or a residual more than `divergenceDecades` above its window minimum),
+            'plateau' (full window with less than `plateauDecades` change over the window) or 'running'
+        '''
+        stats = self.statistics()
+        if self.finished:
+            self.status = 'finished'
+        elif not stats:
+            self.status = 'running'
+        elif any(not np.isfinite(s['last']) or np.log10(max(s['last'], residualFloor)/max(s['min'], residualFloor)) > divergenceDecades for s in stats.values()):
+            self.status = 'diverged'
+        elif all(s['last'] < tolerance for s in stats.values()):
+            self.status = 'converged'
+        elif all(s['samples'] == self.window and abs(s['slope'])*self.window < plateauDecades for s in stats.values()):
+            self.status = 'plateau'
+        else:
+            self.status = 'running'
+        return stats
+
+    def requestStop(self, stopAt='writeNow'):
+        '''
+            Ask the running solver to stop by setting `stopAt` in system/controlDict (read by the solver
+            at the next iteration as long as runTimeModifiable is on). The previous entry is kept in
+            `originalStopAt` and restored by `follow` once the run has ended
+        '''
+        self.originalStopAt = setStopAt(self.controlDict, stopAt)
+        self.stopRequested = True
+
+def setStopAt(controlDict, stopAt):
+    '''
+        Replace the `stopAt` entry of a controlDict, the file is replaced atomically.
+        Returns the previous value of the entry
+    '''
+    with open(controlDict, 'r') as f:
+        text = f.read()
+    entry = re.compile(r'^(\s*stopAt\s+)(\w+)\s*;', flags=re.MULTILINE)
+    previous = entry.search(text)
+    if previous is None:
+        raise ValueError(f"No stopAt entry in {controlDict}")
+    text = entry.sub(r'\g<1>'+stopAt+';', text)
+    with open(controlDict+'.tmp', 'w') as f:
+        f.write(text)
+    os.replace(controlDict+'.tmp', controlDict)
+    return previous.group(2)
+
+async def follow(monitor, pollInterval, settings):
+    '''
+        Poll one log without blocking the other logs, request a stop once a case converged or plateaued
+        and restore the original `stopAt` entry when the stopped run has ended, so the next run of the case starts normally.
+        Only a log that is still growing is stopped, a log that stopped growing for `staleAfter` seconds
+        (crashed run) or that was replaced by a newer log of the same case is no longer followed
+    '''
+    try:
+        while True:
+            await asyncio.to_thread(monitor.poll)
+            monitor.classify(settings['tolerance'], settings['plateauDecades'], settings['divergenceDecades'])
+            if monitor.finished:
+                return
+            if monitor.superseded:
+                monitor.status = 'superseded'
+                return
+            if time.time()-monitor.lastGrowth > settings['staleAfter']:
+                monitor.status = 'stale'
+                return
+            if (settings['autoStop'] and monitor.grew and not monitor.stopRequested
+                    and monitor.status in settings['stopOn']):
+                monitor.requestStop()
+                print(f"*** {monitor.logfile}: {monitor.status}, stop requested in {monitor.controlDict} ***")
+            # Watch a stopped run closely so that stopAt is restored before the next run starts
+            await asyncio.sleep(settings['stopPollInterval'] if monitor.stopRequested else pollInterval)
+    finally:
+        if monitor.stopRequested:
+            setStopAt(monitor.controlDict, monitor.originalStopAt)
+
+def report(monitors):
+    print(time.strftime('%H:%M:%S')+' '+'-'*60)
+    for monitor in monitors.values():
+        stats = monitor.statistics()
+        worst = max(stats.items(), key=lambda item: item[1]['last'], default=(None, None))
+        if worst[0] is None:
+            print(f"{monitor.logfile:40s} {monitor.status:10s}")
+        else:
+            print(f"{monitor.logfile:40s} {monitor.status:10s} iter {len(monitor.times):7d} | max residual {worst[0]} = {worst[1]['last']:.3e}"
+                  f" | slope {worst[1]['slope']:.2e} dec/iter")
+
+async def main(pattern, window, pollInterval, reportInterval, settings):
+    monitors, active, tasks = {}, {}, []
+    while True:
+        # The runs of a case share one controlDict, only its most recently modified log is followed
+        newest = {}
+        for logfile in glob.glob(pattern):
+            caseDir, mtime = caseDirectory(logfile), os.path.getmtime(logfile)
+            if caseDir not in newest or mtime > newest[caseDir][0]:
+                newest[caseDir] = (mtime, logfile)
+        for caseDir, (mtime, logfile) in sorted(newest.items()):
+            if logfile in monitors:
+                continue
+            # Pick up logs of runs that started after the monitor
+            if caseDir in active:
+                active[caseDir].superseded = True
+            monitors[logfile] = active[caseDir] = LogMonitor(logfile, window)
+            tasks.append(asyncio.create_task(follow(monitors[logfile], pollInterval, settings)))
+        report(active)
+        if tasks and all(task.done() for task in tasks) and settings['exitWhenDone']:
+            return monitors
+        await asyncio.sleep(reportInterval)
+
+
+if __name__ == '__main__':
+
+    # USER INPUT
+    pattern = 'logs/*_run_*.log'            # Logs to follow, the case of logs/x.log is the current directory
+    window = 500                            # Iterations in the rolling window
+    pollInterval = 5.0                      # Seconds between reads of a log
+    reportInterval = 60.0                   # Seconds between status tables
+    settings = {
+        'tolerance': 1e-5,                  # Converged when all initial residuals are below this value
+        'plateauDecades': 0.05,             # Plateau when all residuals changed less than this over the window
+        'divergenceDecades': 3.0,           # Diverged when a residual grew more than this above its window minimum
+        'autoStop': False,                  # Write `stopAt writeNow;` to system/controlDict of flagged cases
+        'stopOn': ('converged', 'plateau'),
+        'exitWhenDone': True,               # Stop the monitor when all followed runs ended
+        'staleAfter': 900.0,                # Seconds without new lines after which a run is considered dead
+        'stopPollInterval': 0.5,            # Seconds between reads of a log after a stop was requested
+    }
+
+    asyncio.run(main(pattern, window, pollInterval, reportInterval, settings))
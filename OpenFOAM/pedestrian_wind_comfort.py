@@ -6,6 +6,8 @@ import time
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+from functions import load_direction_stack
+from wind_climate import WindClimate, log_law_speed
 #
 # USER INPUT PARAMETERS
 #
@@ -18,6 +20,7 @@ z_comfort = 2.0                                                             # He
 # Path to the weather station data
 wind_datafilename = 'wind_data_pwc.txt'
 sim_file_prefix = '/Volumes/Akshay2TB/macDesktop/Manuscripts/InReview/PatilGarciaSanchez2024-LoD/data/tarballs/lod2p2_denhaag/Umag_2'
+stacked_filename = None                         # Optional consolidated (directions x points) .npy file, memory-mapped and rebuilt when the binary files change
 # Log-Law profile parameters
 zreference = 10.0                               # Reference height (m)
 boundary_condition_value = 5.0                  # Boundary condition used for the simulation (m/s)
@@ -25,6 +28,7 @@ z0 = 0.5                                        # Roughness length (m)
 kappa = 0.41                                    # von Karman constant
 Cmu = 0.09                                      # k-Epsilon constant
 exceedance_value = 5.0                          # This is according to NEN8100 - Maybe different for other cases
+use_histogram_engine = True                     # Bucket the weather data by (direction, speed) instead of looping over every record
 number_of_wind_directions = len(input_wind_directions)                  # Number of wind directions (degrees)
 # DEBUG SWITCH
 debug_switch = False                            # Debug Switch for testing
@@ -49,69 +53,109 @@ else:
 #
 print("WARNING - This data structure assumes - ")
 print("     First column is wind speed | Second column is wind direction")
-data = np.loadtxt(wind_datafilename)
-wind_speed = data[:,0]
-wind_direction = data[:,1]
-print(f"Historical Wind Dataframe size: {len(data)}")
+climate = WindClimate(wind_datafilename)
+wind_speed = climate.speed
+print(f"Historical Wind Dataframe size: {len(climate)}")
 print(f"Minimum speed: {np.min(wind_speed)} | Maximum speed: {np.max(wind_speed)}")
 # Replace all entries corresponding to 0 with 360 since simulation uses 360 and not 0
 # This is for data values that are closer to 0 but smaller than half of the step size - only valid for uniform stepping
-if(is_fixed_interval):
-    wind_direction[wind_direction < wind_step/2] = 360      
-wind_direction[wind_direction == 0] = 360
-# # Clear memory
-del data
+wind_direction = climate.simulation_directions(input_wind_directions)
 #
 # Now load all the wind magnitude data
 #
-# Define read data function
-def readdata(filename):
-    with open(filename, 'rb') as f:
-        f.seek(0)
-        data = np.fromfile(f, dtype=np.float64)
-    return data
-# Read all data into a single dataframe for easy access
-setup_data = True
-print("*** Loading the simulation data to memory ***")
+# Define the histogram based comfort class engine
+def exceedance_count_histogram(simulation_data, norm_U, record_direction, wind_speed,
+                               zreference, z_comfort, z0, kappa, exceedance_value):
+    '''
+        Count the number of weather records for which each point exceeds the threshold
+        by bucketing the records per (simulated direction, speed) pair. Every direction
+        only needs one sort of its normalised field and one searchsorted for all the
+        unique speeds in its bucket, so the cost does not grow with the number of records.
+    INPUT
+        simulation_data:        [array like] Simulation data (directions x points), may be memory-mapped
+        norm_U:                 [float] Normalisation of the simulation data (boundary condition value at z_comfort)
+        record_direction:       [numpy array] Index of the nearest simulated direction of every historical record
+                                (see `WindClimate.nearest_simulated_direction`)
+        wind_speed:             [numpy array] Historical wind speed at the reference height
+        zreference:             [float] Reference height of the weather station (m)
+        z_comfort:              [float] Height of the comfort class (m)
+        z0:                     [float] Roughness length (m)
+        kappa:                  [float] von Karman constant
+        exceedance_value:       [float] Threshold wind speed (m/s)
+    OUTPUT
+        exceedance_count:       [numpy array] Number of records exceeding the threshold per point
+    '''
+    data_size = np.shape(simulation_data)[1]
+    exceedance_count = np.zeros((data_size))
+    # Bucket the records by (simulated direction, speed)
+    buckets, bucket_counts = np.unique(np.column_stack((record_direction, wind_speed)), axis=0, return_counts=True)
+    bucket_direction = buckets[:, 0].astype(int)
+    # Wind speed at the comfort height for every bucket (same arithmetic as the record loop)
+    bucket_Ucomfort = log_law_speed(buckets[:, 1], z_comfort, zreference, z0, kappa)
+    for direction_index in tqdm(np.unique(bucket_direction), desc="Computing comfort class"):
+        # Records without wind can never exceed a (positive) threshold
+        in_bucket = (bucket_direction == direction_index) & (bucket_Ucomfort > 0)
+        Ucomfort = bucket_Ucomfort[in_bucket]
+        counts = bucket_counts[in_bucket]
+        if len(Ucomfort) == 0:
+            continue
+        # Sort the normalised field once for this direction
+        normalised_field = simulation_data[direction_index, :]/norm_U
+        order = np.argsort(normalised_field, kind='stable')
+        sorted_field = normalised_field[order]
+        # First sorted index that exceeds the threshold for every speed in the bucket
+        with np.errstate(over='ignore', divide='ignore'):
+            first_exceeding = np.searchsorted(sorted_field, exceedance_value/Ucomfort, side='right')
+        # Correct for round-off in the division so that the result matches `field*Ucomfort > threshold` exactly
+        while True:
+            step_back = (first_exceeding > 0) & \
+                (sorted_field[np.maximum(first_exceeding-1, 0)]*Ucomfort > exceedance_value)
+            step_forward = (first_exceeding < data_size) & \
+                ~(sorted_field[np.minimum(first_exceeding, data_size-1)]*Ucomfort > exceedance_value)
+            if not (np.any(step_back) or np.any(step_forward)):
+                break
+            first_exceeding[step_back] = np.searchsorted(sorted_field, sorted_field[first_exceeding[step_back]-1], side='left')
+            first_exceeding[step_forward] = np.searchsorted(sorted_field, sorted_field[first_exceeding[step_forward]], side='right')
+        # Every point from `first_exceeding` onwards gets the record count of that speed
+        counts_per_position = np.cumsum(np.bincount(first_exceeding, weights=counts, minlength=data_size+1))[:data_size]
+        exceedance_count[order] += counts_per_position
+    return exceedance_count
+# Memory-map all directions as a single (directions x points) array, rows are only read when used
+print("*** Memory-mapping the simulation data ***")
 time1 = time.time()
-for wind_index, iter in zip(input_wind_directions,range(0,len(input_wind_directions))):        
-    # Round the input_wind_direction to the nearest available integer
-    wind_index_load = int(wind_index)
-    if(debug_switch):
-        print(f'{sim_file_prefix}_{wind_index_load}.bin')
-    tempdata = readdata(f'{sim_file_prefix}_{wind_index_load}.bin')            
-    if(setup_data):       
-        data_size = np.shape(tempdata)[0]        
-        simulation_data = np.zeros((number_of_wind_directions,data_size))
-        setup_data = False
-    # Assign the data to the correct wind direction
-    simulation_data[iter,:] = tempdata    
-print(f"*** Simulation data loaded in {time.time()-time1:.2f} seconds ***")
+if(debug_switch):
+    print(f'{sim_file_prefix}_{int(input_wind_directions[0])}.bin ... {sim_file_prefix}_{int(input_wind_directions[-1])}.bin')
+simulation_data = load_direction_stack(sim_file_prefix, input_wind_directions, stacked_filename=stacked_filename)
+data_size = simulation_data.shape[1]
+print(f"*** Simulation data mapped in {time.time()-time1:.2f} seconds ***")
 # 
 # Now we can calculate the comfort class
 #
 print("NOTICE: The comfort class calculations rounds the wind direction to the nearest integer value!")
 # Get the value of the wind speed at the zcomfort height
-ustar = (boundary_condition_value*kappa)/(np.log((zreference+z0)/z0))
-norm_U = (ustar/kappa)*np.log((z_comfort+z0)/z0) 
-# Normalise the simulation data by the boundary condition value used in the simulation
-simulation_data /= norm_U
+norm_U = log_law_speed(boundary_condition_value, z_comfort, zreference, z0, kappa)
+# The simulation data is normalised by the boundary condition value used in the simulation (norm_U) when it is used
 # Initialize the comfort class array
 comfort_class = np.zeros((data_size))
-# Loop over historical wind data and calculate the comfort class
-for wind_index in tqdm(range(len(wind_speed)), desc="Computing comfort class"):
-    #
-    # Preliminary calculations
-    #
-    ustar = (wind_speed[wind_index]*kappa)/(np.log((zreference+z0)/z0))
-    Ucomfort = (ustar/kappa)*np.log((z_comfort+z0)/z0)        
-    # Get the wind direction
-    difference_array_wind_directions = input_wind_directions - np.round(wind_direction[wind_index])
-    wind_direction_index = np.where(np.min(abs(difference_array_wind_directions)) == abs(difference_array_wind_directions))[0]      
-    # Use the wind_direction_index data to classify the comfort
-    tempdata = simulation_data[wind_direction_index[0],:]*Ucomfort
-    # Calculate the comfort class
-    comfort_class[tempdata > exceedance_value] += 1
+if(use_histogram_engine):
+    # Nearest simulated direction of every record (first match on ties, as in the record loop)
+    record_direction = climate.nearest_simulated_direction(input_wind_directions)
+    comfort_class += exceedance_count_histogram(simulation_data, norm_U, record_direction, wind_speed,
+                                                zreference, z_comfort, z0, kappa, exceedance_value)
+else:
+    # Loop over historical wind data and calculate the comfort class
+    for wind_index in tqdm(range(len(wind_speed)), desc="Computing comfort class"):
+        #
+        # Preliminary calculations
+        #
+        Ucomfort = log_law_speed(wind_speed[wind_index], z_comfort, zreference, z0, kappa)
+        # Get the wind direction
+        difference_array_wind_directions = input_wind_directions - np.round(wind_direction[wind_index])
+        wind_direction_index = np.where(np.min(abs(difference_array_wind_directions)) == abs(difference_array_wind_directions))[0]      
+        # Use the wind_direction_index data to classify the comfort
+        tempdata = (simulation_data[wind_direction_index[0],:]/norm_U)*Ucomfort
+        # Calculate the comfort class
+        comfort_class[tempdata > exceedance_value] += 1
 # Calculate the comfort class
 comfort_class /= len(wind_speed)
 # Export comfort class Probability to disk
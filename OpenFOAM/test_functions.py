@@ -0,0 +1,17 @@
+import numpy as np
+from functions import generate_uniform_points
+
+def test_stratified_points_in_a_plane():
+    # Pedestrian-level probes: z_min == z_max must not hang and keeps one jittered point per xy cell
+    points = generate_uniform_points(0, 100, 0, 50, 1.5, 1.5, 1000, seed=1, method='stratified')
+    assert points.shape == (1000, 3)
+    assert np.all(points[:, 2] == 1.5)
+    assert np.all((points[:, 0] >= 0) & (points[:, 0] <= 100) & (points[:, 1] >= 0) & (points[:, 1] <= 50))
+    assert len(np.unique(points[:, :2], axis=0)) == 1000
+
+def test_stratified_points_on_a_line_and_a_point():
+    line = generate_uniform_points(0, 100, 3, 3, 1.5, 1.5, 10, seed=1, method='stratified')
+    # One point in each of the 10 cells along x
+    assert np.array_equal(np.sort(np.floor(line[:, 0]/10)), np.arange(10))
+    point = generate_uniform_points(1, 1, 3, 3, 1.5, 1.5, 4, seed=1, method='stratified')
+    assert np.all(point == [1, 3, 1.5])
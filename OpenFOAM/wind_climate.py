@@ -0,0 +1,257 @@
+import os
+import numpy as np
+#
+# Log-law scaling of the wind speed
+#
+def log_law_speed(speed, z, zreference, z0, kappa=0.41):
+    '''
+        Wind speed at height z from the speed at the reference height with the log-law profile
+    INPUT
+        speed:      [float or numpy array] Wind speed at the reference height (m/s)
+        z:          [float] Height of the output speed (m)
+        zreference: [float] Reference height (m)
+        z0:         [float] Roughness length (m)
+        kappa:      [float] von Karman constant
+    OUTPUT
+        speed_z:    [float or numpy array] Wind speed at height z (m/s)
+    '''
+    ustar = (speed*kappa)/(np.log((zreference+z0)/z0))
+    return (ustar/kappa)*np.log((z+z0)/z0)
+#
+# Weather station data
+#
+class WindClimate:
+    '''
+        Wind climate of a weather station. The text file (first column wind speed, second column wind
+        direction) is parsed once into `filename`.npz, which is reused while the size and modification
+        time of the text file do not change. Histograms are computed once per binning and kept.
+    INPUT
+        filename:   [string] Weather station data
+        use_cache:  [boolean] Read and write the `.npz` cache next to the text file
+    '''
+    def __init__(self, filename, use_cache=True):
+        self.filename = filename
+        status = os.stat(filename)
+        cache_file = filename+'.npz'
+        data = None
+        if use_cache and os.path.isfile(cache_file):
+            with np.load(cache_file) as cache:
+                if cache['mtime_ns'] == status.st_mtime_ns and cache['size'] == status.st_size:
+                    data = cache['data']
+        if data is None:
+            data = np.loadtxt(filename)
+            if use_cache:
+                np.savez(cache_file+'.part.npz', data=data, mtime_ns=status.st_mtime_ns, size=status.st_size)
+                os.replace(cache_file+'.part.npz', cache_file)
+        self.speed = np.ascontiguousarray(data[:, 0])
+        self.direction = np.ascontiguousarray(data[:, 1])
+        self._histograms = {}
+
+    def __len__(self):
+        return len(self.speed)
+
+    def speed_at(self, z, zreference, z0, kappa=0.41):
+        '''
+            Speed of every record at height z (see `log_law_speed`)
+        '''
+        return log_law_speed(self.speed, z, zreference, z0, kappa)
+
+    def simulation_directions(self, input_wind_directions):
+        '''
+            Record directions on the convention of the simulations: 0 is 360 and, for equidistant
+            simulated directions, values below half a step also belong to 360
+        INPUT
+            input_wind_directions:  [numpy array] Simulated wind directions
+        OUTPUT
+            direction:              [numpy array] Copy of the record directions
+        '''
+        direction = self.direction.copy()
+        steps = np.diff(input_wind_directions)
+        if len(steps) and np.allclose(steps, steps[0]):
+            direction[direction < steps[0]/2] = 360
+        direction[direction == 0] = 360
+        return direction
+
+    def nearest_simulated_direction(self, input_wind_directions):
+        '''
+            Index of the nearest simulated direction of every record, after rounding the record direction
+            to the nearest degree (first match on ties)
+        '''
+        direction = self.simulation_directions(input_wind_directions)
+        unique_directions, inverse_directions = np.unique(np.round(direction), return_inverse=True)
+        nearest_direction = np.argmin(abs(input_wind_directions[None, :] - unique_directions[:, None]), axis=1)
+        return nearest_direction[inverse_directions.ravel()]
+
+    def histogram2d(self, direction_bins=360, speed_bins=50):
+        '''
+            Density histogram of (direction, speed) as np.histogram2d, computed once per binning
+        '''
+        key = ('joint', direction_bins, speed_bins)
+        if key not in self._histograms:
+            self._histograms[key] = np.histogram2d(self.direction, self.speed, bins=[direction_bins, speed_bins], density=True)
+        return self._histograms[key]
+
+    def joint_pdf(self, direction_bins=360, speed_bins=50):
+        '''
+            Joint (direction x speed) probabilities and the bin centers
+        '''
+        hist, xedges, yedges = self.histogram2d(direction_bins, speed_bins)
+        return hist/hist.sum(), 0.5*(xedges[:-1]+xedges[1:]), 0.5*(yedges[:-1]+yedges[1:])
+
+    def direction_pdf(self, bins=360):
+        '''
+            Marginal direction probabilities, CDF and bin centers
+        '''
+        key = ('direction', bins)
+        if key not in self._histograms:
+            self._histograms[key] = np.histogram(self.direction, bins=bins, density=False)
+        count, edges = self._histograms[key]
+        pdf = count/np.sum(count)
+        return pdf, np.cumsum(pdf), 0.5*(edges[:-1]+edges[1:])
+
+    def speed_pdf(self, bins=50):
+        '''
+            Marginal speed probabilities, CDF and bin centers
+        '''
+        key = ('speed', bins)
+        if key not in self._histograms:
+            self._histograms[key] = np.histogram(self.speed, bins=bins, density=False)
+        count, edges = self._histograms[key]
+        pdf = count/np.sum(count)
+        return pdf, np.cumsum(pdf), 0.5*(edges[:-1]+edges[1:])
+
+    def joint_sampler(self, direction_bins=360, speed_bins=50, eps=1e-8):
+        '''
+            Inverse-CDF sampler of the joint histogram (see `JointWindSampler`)
+        '''
+        return JointWindSampler(*self.joint_pdf(direction_bins, speed_bins), eps=eps)
+#
+# Sampling of the joint PDF
+#
+def monotone_cdf(cdf, eps=1e-8):
+    '''
+        Normalise CDFs along the last axis and make them strictly increasing: a value that does not
+        exceed its predecessor is set to the predecessor + eps. The recursion r[i] = max(c[i], r[i-1]+eps)
+        equals i*eps + cummax(c[j]-j*eps), so all rows are fixed at once. Rows without mass become linear.
+    '''
+    cdf = np.array(cdf, dtype=float)
+    last = cdf[..., -1:]
+    empty = (last == 0)[..., 0]
+    cdf = np.divide(cdf, last, out=np.zeros_like(cdf), where=last != 0)
+    cdf[empty] = np.linspace(0, 1, cdf.shape[-1])
+    steps = np.arange(cdf.shape[-1])*eps
+    cdf = steps+np.maximum.accumulate(cdf-steps, axis=-1)
+    return cdf/cdf[..., -1:]
+
+def nearest_bin(values, centers):
+    '''
+        Index of the nearest bin center for every value (same result as argmin(|centers-value|))
+    '''
+    return np.searchsorted(0.5*(centers[1:]+centers[:-1]), values)
+
+class JointWindSampler:
+    '''
+        Batched inverse-CDF sampler of a 2D (direction x speed) histogram. Unit-square samples from LHS,
+        MDA or plain Monte-Carlo are mapped to directions with the marginal CDF and to speeds with the
+        CDF of the nearest direction bin, for all samples in one vectorised interpolation each.
+    INPUT
+        pdf:        [numpy array] (direction bins x speed bins) probabilities
+        xcenters:   [numpy array] Direction bin centers
+        ycenters:   [numpy array] Speed bin centers
+        eps:        [float] Minimum step of the monotone CDFs
+    '''
+    def __init__(self, pdf, xcenters, ycenters, eps=1e-8):
+        self.pdf, self.xcenters, self.ycenters = pdf, xcenters, ycenters
+        self.cdf_direction = monotone_cdf(np.cumsum(pdf.sum(axis=1)), eps)
+        self.cdf_speed_given_direction = monotone_cdf(np.cumsum(pdf, axis=1), eps)
+        # All conditional CDFs in one increasing array: row i is shifted by 2*i (a CDF spans at most 1)
+        nrows, ncols = pdf.shape
+        self._offsets = 2.0*np.arange(nrows)
+        self._flat_cdf = (self.cdf_speed_given_direction+self._offsets[:, None]).ravel()
+        self._flat_speed = np.tile(ycenters, nrows)
+
+    def transform(self, unit_samples):
+        '''
+            Map (samples x 2) unit-square samples to directions and speeds
+        '''
+        unit_samples = np.asarray(unit_samples, dtype=float)
+        directions = np.interp(unit_samples[:, 0], self.cdf_direction, self.xcenters)
+        rows = nearest_bin(directions, self.xcenters)
+        # Clamping to the row first reproduces the constant fill values outside the CDF range
+        cdf_rows = self.cdf_speed_given_direction
+        u = np.clip(unit_samples[:, 1], cdf_rows[rows, 0], cdf_rows[rows, -1])
+        speeds = np.interp(u+self._offsets[rows], self._flat_cdf, self._flat_speed)
+        return directions, speeds
+
+    def sample(self, n_samples, method='montecarlo', random_seed=None):
+        '''
+            Draw directions and speeds with 'montecarlo', 'lhs' or 'mda' unit-square samples
+        '''
+        if method == 'montecarlo':
+            unit_samples = np.random.default_rng(random_seed).random((n_samples, 2))
+        elif method == 'lhs':
+            from pyDOE import lhs
+            unit_samples = lhs(2, samples=n_samples, criterion='c')
+        elif method == 'mda':
+            unit_samples = mda_sampling(n_samples, random_seed=random_seed)
+        else:
+            raise ValueError(f"Unknown sampling method `{method}` | Valid methods: montecarlo, lhs or mda")
+        return self.transform(unit_samples)
+
+    def pdf_values(self, directions, speeds):
+        '''
+            PDF of the bins containing the (direction, speed) pairs
+        '''
+        return self.pdf[nearest_bin(directions, self.xcenters), nearest_bin(speeds, self.ycenters)]
+
+def mda_sampling(n_samples, n_candidates=5000, random_seed=None, n_dims=2, candidates=None, periods=None, return_indices=False):
+    '''
+        Maximum dissimilarity (greedy maximin) selection. The distance of every candidate to its nearest
+        selected point is kept in one vector and only updated with the newly selected point, so every
+        iteration costs O(n_candidates x n_dims) without temporary (candidates x selected) arrays.
+    INPUT
+        n_samples:      [integer] Number of points to select
+        n_candidates:   [integer] Number of random candidates in the unit hypercube (if `candidates` is None)
+        random_seed:    [integer] Seed of the global numpy random state, as before
+        n_dims:         [integer] Number of dimensions of the random candidates
+        candidates:     [numpy array] Optional (candidates x dims) array to select from, e.g. direction, speed, stability
+        periods:        [list] Period of every dimension, None for a non-periodic dimension (e.g. [1.0, None]
+                        for a direction mapped to [0, 1) and a speed). Default: no periodic dimension
+        return_indices: [boolean] Also return the indices of the selected candidates
+    OUTPUT
+        selected:       [numpy array] (n_samples x dims) selected points, in selection order
+    '''
+    if random_seed is not None:
+        np.random.seed(random_seed)
+
+    if candidates is None:
+        candidates = np.random.rand(n_candidates, n_dims)
+    candidates = np.asarray(candidates, dtype=float)
+    n_candidates = len(candidates)
+    if periods is None:
+        periods = [None]*candidates.shape[1]
+    # One contiguous array per dimension keeps the update loop free of (candidates x dims) temporaries
+    columns = np.ascontiguousarray(candidates.T)
+    delta = np.empty(n_candidates)
+
+    def squared_distance_to(point):
+        total = np.zeros(n_candidates)
+        for column, value, period in zip(columns, point, periods):
+            np.subtract(column, value, out=delta)
+            np.abs(delta, out=delta)
+            if period is not None:
+                np.minimum(delta, period-delta, out=delta)
+            total += delta*delta
+        return total
+
+    # Squared distances select the same points as distances
+    indices = [np.random.choice(n_candidates)]
+    min_dists = squared_distance_to(candidates[indices[0]])
+    for _ in range(1, n_samples):
+        next_idx = int(np.argmax(min_dists))
+        indices.append(next_idx)
+        np.minimum(min_dists, squared_distance_to(candidates[next_idx]), out=min_dists)
+
+    if return_indices:
+        return candidates[indices], np.array(indices)
+    return candidates[indices]
@@ -2,7 +2,165 @@ import numpy as np
 import matplotlib.pyplot as plt
 import struct
 import os
+import multiprocessing as mp
+from itertools import combinations
 from pathlib import Path
+from read_driver_files import CollatedArray, discover_driver_layout
+
+class StreamingMoments:
+    '''
+    Streaming central moments of several fields at every (y, z) point over time.
+    
+    Whole chunks of timesteps are reduced with numpy and merged with the pairwise
+    update of Chan et al. / Pebay, so the result does not depend on the chunk size
+    and partial results reduced elsewhere can be combined with merge().
+    Keeps the mean, the 2nd, 3rd and 4th central moment sums of every field and
+    the co-moment sums of every pair of fields (uv, uw, vw).
+    '''
+    
+    def __init__(self, components=('u', 'v', 'w')):
+        self.components = tuple(components)
+        self.pairs = list(combinations(range(len(self.components)), 2))
+        self.count = 0
+        self.mean = self.M2 = self.M3 = self.M4 = self.C = None
+        self._scratch = None
+    
+    @classmethod
+    def from_chunk(cls, chunk, components=('u', 'v', 'w'), scratch=None, overwrite=False):
+        '''
+        Moments of one chunk, a list of (t, y, z) arrays in the order of components.
+        With overwrite=True writeable float64 arrays are centred in place (for arrays the
+        caller no longer needs, e.g. fresh reads), otherwise they are copied.
+        scratch is an optional work array of the chunk shape reused between calls.
+        '''
+        moments = cls(components)
+        if overwrite:
+            x = [np.require(data, dtype=np.float64, requirements='W') for data in chunk]
+        else:
+            x = [np.array(data, dtype=np.float64) for data in chunk]
+        shape = x[0].shape
+        if scratch is None or scratch.shape != shape:
+            scratch = np.empty(shape)
+        moments.count = shape[0]
+        moments.mean = np.empty((len(x),) + shape[1:])
+        moments.M2, moments.M3, moments.M4 = (np.empty_like(moments.mean) for _ in range(3))
+        for c, data in enumerate(x):
+            data.mean(axis=0, out=moments.mean[c])
+            data -= moments.mean[c]
+            np.multiply(data, data, out=scratch)
+            scratch.sum(axis=0, out=moments.M2[c])
+            moments.M3[c] = np.einsum('t...,t...->...', scratch, data)
+            moments.M4[c] = np.einsum('t...,t...->...', scratch, scratch)
+        moments.C = np.empty((len(moments.pairs),) + shape[1:])
+        for p, (a, b) in enumerate(moments.pairs):
+            moments.C[p] = np.einsum('t...,t...->...', x[a], x[b])
+        return moments
+    
+    def update(self, chunk, overwrite=False):
+        '''
+        Add a chunk of timesteps, a list of (t, y, z) arrays in the order of components.
+        The arrays are left unchanged unless overwrite=True (see from_chunk).
+        '''
+        if len(chunk[0]) > 0:
+            if self._scratch is None or self._scratch.shape != np.shape(chunk[0]):
+                self._scratch = np.empty(np.shape(chunk[0]))
+            self.merge(StreamingMoments.from_chunk(chunk, self.components, self._scratch, overwrite))
+        return self
+    
+    def merge(self, other):
+        '''Combine with the moments of another (disjoint) set of timesteps.'''
+        if other.components != self.components:
+            raise ValueError(f"Cannot merge moments of {other.components} into {self.components}")
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count = other.count
+            self.mean, self.M2, self.M3, self.M4, self.C = (
+                other.mean.copy(), other.M2.copy(), other.M3.copy(), other.M4.copy(), other.C.copy())
+            return self
+        na, nb = self.count, other.count
+        n = na + nb
+        delta = other.mean - self.mean
+        delta2 = delta * delta
+        # Higher moments first, they need the old lower moments
+        self.M4 += (other.M4 + delta2 * delta2 * na * nb * (na*na - na*nb + nb*nb) / n**3
+                    + 6 * delta2 * (na*na * other.M2 + nb*nb * self.M2) / n**2
+                    + 4 * delta * (na * other.M3 - nb * self.M3) / n)
+        self.M3 += (other.M3 + delta2 * delta * na * nb * (na - nb) / n**2
+                    + 3 * delta * (na * other.M2 - nb * self.M2) / n)
+        self.M2 += other.M2 + delta2 * na * nb / n
+        for p, (a, b) in enumerate(self.pairs):
+            self.C[p] += other.C[p] + delta[a] * delta[b] * na * nb / n
+        self.mean += delta * nb / n
+        self.count = n
+        return self
+    
+    @classmethod
+    def join(cls, blocks):
+        '''Join the moments of adjacent y ranges over the same timesteps, in y order.'''
+        if any(block.count != blocks[0].count for block in blocks):
+            raise ValueError("All y ranges must cover the same timesteps")
+        moments = cls(blocks[0].components)
+        moments.count = blocks[0].count
+        for name in ('mean', 'M2', 'M3', 'M4', 'C'):
+            setattr(moments, name, np.concatenate([getattr(block, name) for block in blocks], axis=1))
+        return moments
+    
+    def __getstate__(self):
+        # The scratch array is not sent between processes
+        state = self.__dict__.copy()
+        state['_scratch'] = None
+        return state
+    
+    def statistics(self):
+        '''
+        Statistics at every (y, z) point: {c}_mean, {c}_variance, {c}_rms, {c}_skewness,
+        {c}_flatness for every component c and the covariance (Reynolds stress) of every pair, e.g. 'uw'.
+        '''
+        return self._statistics(self.mean, self.M2 / self.count, self.M3 / self.count,
+                                self.M4 / self.count, self.C / self.count)
+    
+    def profiles(self):
+        '''
+        Spanwise averaged (z) profiles of the same statistics. The central moments are
+        averaged over y before the skewness and flatness are formed.
+        '''
+        n = self.count
+        return self._statistics(self.mean.mean(axis=1), (self.M2 / n).mean(axis=1), (self.M3 / n).mean(axis=1),
+                                (self.M4 / n).mean(axis=1), (self.C / n).mean(axis=1))
+    
+    def _statistics(self, mean, m2, m3, m4, cov):
+        stats = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for c, name in enumerate(self.components):
+                stats[f'{name}_mean'] = mean[c]
+                stats[f'{name}_variance'] = m2[c]
+                stats[f'{name}_rms'] = np.sqrt(m2[c])
+                stats[f'{name}_skewness'] = m3[c] / m2[c]**1.5
+                stats[f'{name}_flatness'] = m4[c] / m2[c]**2
+        for p, (a, b) in enumerate(self.pairs):
+            stats[self.components[a] + self.components[b]] = cov[p]
+        return stats
+
+
+def moments_job(args):
+    '''
+    Reduce the y rows of one processor file over one timestep range into partial moments.
+    All configuration is passed explicitly so that the job runs under any start method.
+    '''
+    (experiment_number, nprocy, ny_total, nz, directory, components, has_ghost,
+     j_range, t_range, chunk_size) = args
+    reader = DriverFileReader(experiment_number=experiment_number, nprocy=nprocy)
+    fields = [reader.open_field(name, ny_total, nz, directory, has_ghost=has_ghost)
+              for name in components]
+    j0, j1 = j_range
+    moments = StreamingMoments(components)
+    for chunk_start in range(t_range[0], t_range[1], chunk_size):
+        chunk_end = min(chunk_start + chunk_size, t_range[1])
+        # Only the file of this processor is read, the fresh reads are centred in place
+        moments.update([field[chunk_start:chunk_end, j0:j1] for field in fields], overwrite=True)
+    return j_range, t_range, moments
+
 
 class DriverFileReader:
     '''
@@ -19,7 +177,32 @@ class DriverFileReader:
         self.exp_nr = f"{int(experiment_number):03d}"
         self.nprocy = nprocy
         self.job_nr = f"{int(job_number):03d}" if job_number else self.exp_nr
+        self.layout = None
         
+    def discover_layout(self, directory='.', ny=None, nz=None, nsv=None, use_cache=True):
+        '''
+        Discover and check the layout of the driver files from namoptions,
+        lscale.inp and the tdriver length (cached, see discover_driver_layout).
+        '''
+        self.layout = discover_driver_layout(self.exp_nr, directory, self.nprocy, ny, nz, nsv,
+                                             self.job_nr, use_cache)
+        return self.layout
+    
+    def _from_layout(self, ny_local, nz, scalar_fields, has_ghost):
+        '''
+        Discovered layout when it describes this grid, with the number of scalars and
+        ghost cells it found. Explicit values win, without a layout the defaults are
+        one scalar field and ghost cells.
+        '''
+        layout = self.layout
+        if layout is None or (layout['ny_local'], layout['nz']) != (ny_local, nz):
+            layout = None
+        if scalar_fields is None:
+            scalar_fields = (layout['nsv'] or 1) if layout else 1
+        if has_ghost is None:
+            has_ghost = layout['has_ghost'] if layout else True
+        return layout, scalar_fields, has_ghost
+    
     def read_time_file(self, directory='.'):
         '''Read the time stamp file'''
         filename = f"tdriver_000.{self.job_nr}"
@@ -38,10 +221,11 @@ class DriverFileReader:
         return times
     
     def get_field_info(self, field_name, ny_local, nz, directory='.', 
-                       scalar_fields=1, has_ghost=True):
+                       scalar_fields=None, has_ghost=None):
         '''
         Get field metadata without reading data.
-        Returns record size and number of timesteps.
+        Returns record size and number of timesteps. scalar_fields, has_ghost and
+        the number of records default to the discovered layout (see discover_layout).
         '''
         driver_id = "000"
         filename = f"{field_name}driver_{driver_id}.{self.exp_nr}"
@@ -50,6 +234,7 @@ class DriverFileReader:
         if not filepath.exists():
             raise FileNotFoundError(f"Field file not found: {filepath}")
         
+        layout, scalar_fields, has_ghost = self._from_layout(ny_local, nz, scalar_fields, has_ghost)
         jh = 1 if has_ghost else 0
         kh = 1 if has_ghost else 0
         ny_local_total = ny_local + 2 * jh
@@ -60,74 +245,84 @@ class DriverFileReader:
         else:
             record_size = ny_local_total * nz_total * 8
         
-        file_size = filepath.stat().st_size
-        n_timesteps = file_size // record_size
+        info = layout['fields'].get(field_name) if layout else None
+        if info is not None and info['record_size'] == record_size:
+            # The layout already checked every file
+            n_timesteps, partial = info['n_records'][0], 0
+        else:
+            n_timesteps, partial = divmod(filepath.stat().st_size, record_size)
+        if partial:
+            print(f"  WARNING: {filename} is not a whole number of {record_size}-byte records, "
+                  f"check ny, nz and has_ghost (or use discover_layout)")
         
         return record_size, n_timesteps, ny_local_total, nz_total
     
-    def read_field_timestep(self, field_name, timestep, ny_total, nz, directory='.', 
-                           scalar_fields=1, has_ghost=True):
+    def open_field(self, field_name, ny_total, nz, directory='.', 
+                   scalar_fields=None, has_ghost=None):
         '''
-        Read a SINGLE timestep from all processors.
-        Much more memory efficient for processing one timestep at a time.
+        Memory-map the field files of all processors as one lazy collated array.
+        Nothing is read until it is indexed, and then only from the processors
+        that hold the requested y rows. With a discovered layout the ghost cells,
+        scalars and record counts are taken from it and every field is cut to the
+        time steps that all fields and tdriver have.
         '''
         ny_local = ny_total // self.nprocy
+        layout, scalar_fields, has_ghost = self._from_layout(ny_local, nz, scalar_fields, has_ghost)
         jh = 1 if has_ghost else 0
         
         record_size, _, ny_local_total, nz_total = self.get_field_info(
             field_name, ny_local, nz, directory, scalar_fields, has_ghost
         )
+        info = layout['fields'].get(field_name) if layout else None
+        if info is not None and info['record_size'] != record_size:
+            info = None
         
-        # Read from each processor
+        # Records are stored in Fortran order, a C-ordered (k, j) or (m, k, j) block
+        # exposed as a (t, j, k) or (t, j, k, m) view
         proc_data = []
         for proc_id in range(self.nprocy):
             driver_id = f"{proc_id:03d}"
             filename = f"{field_name}driver_{driver_id}.{self.exp_nr}"
             filepath = Path(directory) / filename
             
-            with open(filepath, 'rb') as f:
-                f.seek(timestep * record_size)
-                data = f.read(record_size)
-                
-                if len(data) < record_size:
-                    raise ValueError(f"Incomplete data at timestep {timestep}")
-                
-                values = np.frombuffer(data, dtype=np.float64)
-                
-                if field_name == 's':
-                    field_data = values.reshape((ny_local_total, nz_total, scalar_fields), order='F')
-                else:
-                    field_data = values.reshape((ny_local_total, nz_total), order='F')
-                
-                proc_data.append(field_data)
-        
-        # Collate data
-        if len(proc_data) == 1:
-            return proc_data[0]
+            if info is not None:
+                n_available = info['n_records'][proc_id]
+            else:
+                n_available = filepath.stat().st_size // record_size
+            if field_name == 's':
+                shape = (n_available, scalar_fields, nz_total, ny_local_total)
+                axes = (0, 3, 2, 1)
+            else:
+                shape = (n_available, nz_total, ny_local_total)
+                axes = (0, 2, 1)
+            if n_available == 0:
+                proc_data.append(np.empty(shape).transpose(axes))
+            else:
+                proc_data.append(np.memmap(filepath, dtype=np.float64, mode='r', shape=shape).transpose(axes))
+        
+        # Keep the time steps all processors have written
+        n_common = min(len(data) for data in proc_data)
+        if any(len(data) != n_common for data in proc_data):
+            print(f"  WARNING: Using the first {n_common} time steps that all '{field_name}' files wrote")
+        if info is not None:
+            n_common = min(n_common, layout['n_complete'])
+        return CollatedArray([data[:n_common] for data in proc_data], jh)
+    
+    def read_field_timestep(self, field_name, timestep, ny_total, nz, directory='.', 
+                           scalar_fields=None, has_ghost=None):
+        '''
+        Read a SINGLE timestep from all processors.
+        Much more memory efficient for processing one timestep at a time.
+        '''
+        field = self.open_field(field_name, ny_total, nz, directory, scalar_fields, has_ghost)
+        if timestep >= len(field):
+            raise ValueError(f"Incomplete data at timestep {timestep}")
         
-        if field_name == 's':
-            collated_parts = []
-            for i, data in enumerate(proc_data):
-                if i == 0:
-                    collated_parts.append(data[:, :, :])
-                elif i == len(proc_data) - 1:
-                    collated_parts.append(data[jh:, :, :])
-                else:
-                    collated_parts.append(data[jh:-jh, :, :])
-            return np.concatenate(collated_parts, axis=0)
-        else:
-            collated_parts = []
-            for i, data in enumerate(proc_data):
-                if i == 0:
-                    collated_parts.append(data[:, :])
-                elif i == len(proc_data) - 1:
-                    collated_parts.append(data[jh:, :])
-                else:
-                    collated_parts.append(data[jh:-jh, :])
-            return np.concatenate(collated_parts, axis=0)
+        # Only this record of every processor is read
+        return field[timestep]
     
     def read_field_file(self, field_name, ny_total, nz, n_timesteps, directory='.', 
-                       scalar_fields=1, has_ghost=True, timestep_range=None):
+                       scalar_fields=None, has_ghost=None, timestep_range=None):
         '''
         Read field files with optional timestep range for memory efficiency.
         
@@ -150,155 +345,120 @@ class DriverFileReader:
         print(f"  Total grid: ny={ny_total}, nz={nz}")
         print(f"  Per processor: ny_local={ny_local}")
         
-        jh = 1 if has_ghost else 0
-        kh = 1 if has_ghost else 0
-        ny_local_total = ny_local + 2 * jh
-        nz_total = nz + 2 * kh
-        
-        # Calculate record size
-        if field_name == 's':
-            record_size = ny_local_total * nz_total * scalar_fields * 8
-        else:
-            record_size = ny_local_total * nz_total * 8
-        
-        # Read processor by processor into list (same as original, but only requested timesteps)
-        proc_data = []
-        for proc_id in range(self.nprocy):
-            driver_id = f"{proc_id:03d}"
-            filename = f"{field_name}driver_{driver_id}.{self.exp_nr}"
-            filepath = Path(directory) / filename
-            
-            print(f"  Reading from driver_id={driver_id}...", end=" ")
-            
-            # Allocate array for this processor's data
-            if field_name == 's':
-                field_data = np.zeros((n_steps_to_read, ny_local_total, nz_total, scalar_fields))
-            else:
-                field_data = np.zeros((n_steps_to_read, ny_local_total, nz_total))
-            
-            with open(filepath, 'rb') as f:
-                # Seek to start timestep
-                f.seek(start_t * record_size)
-                
-                # Read only the requested timesteps
-                for local_t in range(n_steps_to_read):
-                    data = f.read(record_size)
-                    if len(data) < record_size:
-                        print(f"WARNING: Incomplete data at timestep {start_t + local_t}")
-                        break
-                    
-                    values = np.frombuffer(data, dtype=np.float64)
-                    
-                    if field_name == 's':
-                        field_data[local_t] = values.reshape((ny_local_total, nz_total, scalar_fields), order='F')
-                    else:
-                        field_data[local_t] = values.reshape((ny_local_total, nz_total), order='F')
-            
-            proc_data.append(field_data)
-            print(f"Done. Shape: {field_data.shape}")
+        field = self.open_field(field_name, ny_total, nz, directory, scalar_fields, has_ghost)
+        if end_t > len(field):
+            print(f"  WARNING: Incomplete data at timestep {len(field)}")
         
-        print(f"  Collating data along y-axis...")
-        
-        # Collate using same logic as original
-        if len(proc_data) == 1:
-            collated_data = proc_data[0]
-        else:
-            if field_name == 's':
-                collated_parts = []
-                for i, data in enumerate(proc_data):
-                    if i == 0:
-                        # First processor: keep all including ghost at end
-                        collated_parts.append(data[:, :, :, :])
-                    elif i == len(proc_data) - 1:
-                        # Last processor: skip ghost at start
-                        collated_parts.append(data[:, jh:, :, :])
-                    else:
-                        # Middle processors: skip ghosts at both ends
-                        collated_parts.append(data[:, jh:-jh, :, :])
-                
-                collated_data = np.concatenate(collated_parts, axis=1)
-            else:
-                collated_parts = []
-                for i, data in enumerate(proc_data):
-                    if i == 0:
-                        # First processor: keep all including ghost at end
-                        collated_parts.append(data[:, :, :])
-                    elif i == len(proc_data) - 1:
-                        # Last processor: skip ghost at start
-                        collated_parts.append(data[:, jh:, :])
-                    else:
-                        # Middle processors: skip ghosts at both ends
-                        collated_parts.append(data[:, jh:-jh, :])
-                
-                collated_data = np.concatenate(collated_parts, axis=1)
+        # Single allocation filled processor by processor, only the requested timesteps are read
+        collated_data = field[start_t:end_t]
         
         print(f"  Final collated shape: {collated_data.shape}")
         print(f"  Value range: [{collated_data.min():.6f}, {collated_data.max():.6f}]")
         
         return collated_data
     
-    def compute_statistics_streaming(self, field_name, ny_total, nz, n_timesteps, 
-                                    directory='.', has_ghost=True, chunk_size=10):
+    def compute_moments_streaming(self, ny_total, nz, n_timesteps, directory='.',
+                                  components=('u', 'v', 'w'), has_ghost=None, chunk_size=100):
         '''
-        Compute mean and RMS profiles WITHOUT loading all data into memory.
-        Uses Welford's online algorithm for numerically stable streaming statistics.
+        Streaming moments of several fields WITHOUT loading all data into memory.
+        Every chunk of timesteps is read once for all components and merged into a
+        StreamingMoments with the parallel (Chan/Pebay) update.
         '''
-        print(f"\nComputing streaming statistics for '{field_name}'")
+        print(f"\nComputing streaming statistics for {', '.join(components)}")
+        
+        fields = [self.open_field(name, ny_total, nz, directory, has_ghost=has_ghost)
+                  for name in components]
+        n_available = min(len(field) for field in fields)
+        if n_available < n_timesteps:
+            print(f"  WARNING: Incomplete data at timestep {n_available}")
+            n_timesteps = n_available
+        if n_timesteps == 0:
+            raise ValueError("No complete timesteps to compute statistics from")
         print(f"  Processing {n_timesteps} timesteps in chunks of {chunk_size}")
         
-        ny_local = ny_total // self.nprocy
-        jh = 1 if has_ghost else 0
-        kh = 1 if has_ghost else 0
-        nz_total = nz + 2 * kh
-        final_ny = ny_total + 2 * jh
-        
-        # Initialize accumulators
-        mean = np.zeros((final_ny, nz_total))
-        M2 = np.zeros((final_ny, nz_total))  # For variance calculation
-        count = 0
-        
-        # Process in chunks
+        moments = StreamingMoments(components)
         for chunk_start in range(0, n_timesteps, chunk_size):
             chunk_end = min(chunk_start + chunk_size, n_timesteps)
-            
-            # Read chunk
-            chunk_data = self.read_field_file(
-                field_name, ny_total, nz, n_timesteps, directory,
-                has_ghost=has_ghost, timestep_range=(chunk_start, chunk_end)
-            )
-            
-            # Update statistics using Welford's algorithm
-            for t in range(chunk_data.shape[0]):
-                for j in range(chunk_data.shape[1]):
-                    count += 1
-                    delta = chunk_data[t, j, :] - mean[j, :]
-                    mean[j, :] += delta / count
-                    delta2 = chunk_data[t, j, :] - mean[j, :]
-                    M2[j, :] += delta * delta2
-            
-            # Free memory
-            del chunk_data
-            
+            moments.update([field[chunk_start:chunk_end] for field in fields], overwrite=True)
             print(f"  Processed timesteps {chunk_start} to {chunk_end}")
         
-        # Compute final statistics
-        variance = M2 / count
-        rms = np.sqrt(variance)
-        
-        # Average over y-direction
-        mean_profile = np.mean(mean, axis=0)
-        rms_profile = np.sqrt(np.mean(variance, axis=0))
+        return moments
+    
+    def compute_moments_parallel(self, ny_total, nz, n_timesteps, directory='.',
+                                 components=('u', 'v', 'w'), has_ghost=None, chunk_size=100,
+                                 n_processes=None, start_method=None):
+        '''
+        Same moments as compute_moments_streaming with the reduction spread over processes.
+        Every task reduces the y rows of one processor file over one timestep range, the
+        parent merges the timestep ranges of each processor and joins the processors along y.
+        '''
+        print(f"\nComputing parallel streaming statistics for {', '.join(components)}")
+        
+        fields = [self.open_field(name, ny_total, nz, directory, has_ghost=has_ghost)
+                  for name in components]
+        n_available = min(len(field) for field in fields)
+        if n_available < n_timesteps:
+            print(f"  WARNING: Incomplete data at timestep {n_available}")
+            n_timesteps = n_available
+        if n_timesteps == 0:
+            raise ValueError("No complete timesteps to compute statistics from")
+        # The workers have no layout, they get its ghost cells explicitly
+        _, _, has_ghost = self._from_layout(ny_total // self.nprocy, nz, None, has_ghost)
+        
+        # Enough timestep ranges per processor file to keep all cores busy
+        n_processes = n_processes or os.cpu_count()
+        n_blocks = min(n_timesteps, -(-n_processes // self.nprocy))
+        t_edges = np.linspace(0, n_timesteps, n_blocks + 1).astype(int)
+        j_edges = [int(offset) for offset in fields[0].offsets]
+        j_ranges = list(zip(j_edges[:-1], j_edges[1:]))
+        t_ranges = [(int(t0), int(t1)) for t0, t1 in zip(t_edges[:-1], t_edges[1:])]
+        tasks = [(self.exp_nr, self.nprocy, ny_total, nz, directory, tuple(components), has_ghost,
+                  j_range, t_range, chunk_size) for j_range in j_ranges for t_range in t_ranges]
+        print(f"  Processing {n_timesteps} timesteps as {len(tasks)} tasks on {min(n_processes, len(tasks))} processes")
+        
+        partial = {}
+        with mp.get_context(start_method).Pool(processes=min(n_processes, len(tasks))) as pool:
+            for j_range, t_range, moments in pool.imap_unordered(moments_job, tasks):
+                partial[j_range, t_range] = moments
+                print(f"  Processed rows {j_range[0]} to {j_range[1]}, timesteps {t_range[0]} to {t_range[1]}")
+        
+        # Merge in a fixed order so that the result does not depend on the scheduling
+        blocks = []
+        for j_range in j_ranges:
+            moments = StreamingMoments(components)
+            for t_range in t_ranges:
+                moments.merge(partial.pop((j_range, t_range)))
+            blocks.append(moments)
+        
+        return StreamingMoments.join(blocks)
+    
+    def compute_statistics_streaming(self, field_name, ny_total, nz, n_timesteps, 
+                                    directory='.', has_ghost=None, chunk_size=10):
+        '''
+        Compute mean and RMS profiles WITHOUT loading all data into memory.
+        The temporal statistics of every (y, z) point are averaged over y.
+        '''
+        moments = self.compute_moments_streaming(ny_total, nz, n_timesteps, directory,
+                                                 (field_name,), has_ghost, chunk_size)
+        profiles = moments.profiles()
         
-        return mean_profile, rms_profile
+        return profiles[f'{field_name}_mean'], profiles[f'{field_name}_rms']
     
     def read_all_fields(self, ny, nz, directory='.',
                        read_temperature=False, read_moisture=False,
-                       read_scalars=False, n_scalars=0, has_ghost=True,
+                       read_scalars=False, n_scalars=None, has_ghost=None,
                        timestep_range=None):
         '''
         Read fields with optional timestep range for memory efficiency.
+        The ghost cells, number of scalars and complete time steps are taken from
+        the discovered layout (see discover_layout) unless given.
         '''
+        layout, _, has_ghost = self._from_layout(ny // self.nprocy, nz, None, has_ghost)
+        if n_scalars is None:
+            n_scalars = layout['nsv'] if layout else 0
         times = self.read_time_file(directory)
+        if layout:
+            times = times[:layout['n_complete']]
         n_timesteps = len(times)
         
         if timestep_range is None:
@@ -356,6 +516,9 @@ if __name__ == "__main__":
     use_streaming = True  # Use streaming statistics (very memory efficient)
     load_subset = True    # Load only a subset of timesteps
     subset_range = (10000, 12500)  # Which timesteps to load if load_subset=True
+    chunk_size = 100      # Timesteps per chunk of the streaming statistics
+    n_processes = None    # Processes of the streaming statistics (None: all cores, 1: serial)
+    check_layout = True   # Check ny, nz and all driver files against namoptions/lscale.inp/tdriver
     
     reader = DriverFileReader(experiment_number=experiment_number, nprocy=nprocy)
     
@@ -363,21 +526,27 @@ if __name__ == "__main__":
         print("="*70)
         print(f"Reading uDALES driver files with nprocy={nprocy}")
         print("="*70)
+        if check_layout:
+            reader.discover_layout(data_dir, ny, nz)
         
         if use_streaming and calc_rms:
-            # OPTION 1: Streaming statistics (minimal memory usage)
+            # OPTION 1: Streaming statistics (minimal memory usage), one pass over u, v and w
             print("\nUsing streaming statistics computation...")
             times = reader.read_time_file(data_dir)
             
-            u_mean_profile, u_rms_profile = reader.compute_statistics_streaming(
-                'u', ny, nz, len(times), data_dir, chunk_size=10
-            )
-            v_mean_profile, v_rms_profile = reader.compute_statistics_streaming(
-                'v', ny, nz, len(times), data_dir, chunk_size=10
-            )
-            w_mean_profile, w_rms_profile = reader.compute_statistics_streaming(
-                'w', ny, nz, len(times), data_dir, chunk_size=10
-            )
+            if n_processes == 1:
+                moments = reader.compute_moments_streaming(
+                    ny, nz, len(times), data_dir, components=('u', 'v', 'w'), chunk_size=chunk_size
+                )
+            else:
+                moments = reader.compute_moments_parallel(
+                    ny, nz, len(times), data_dir, components=('u', 'v', 'w'), chunk_size=chunk_size,
+                    n_processes=n_processes
+                )
+            profiles = moments.profiles()
+            np.savez('driver_statistics_profiles.npz', **profiles)
+            print("Saved mean, rms, Reynolds stress, skewness and flatness profiles to 'driver_statistics_profiles.npz'")
+            u_rms_profile, v_rms_profile, w_rms_profile = (profiles['u_rms'], profiles['v_rms'], profiles['w_rms'])
             
             # Plot streaming results
             z = np.loadtxt(zfile, skiprows=1)[:, 0]
@@ -399,8 +568,7 @@ if __name__ == "__main__":
             data = reader.read_all_fields(
                 ny=ny, nz=nz, directory=data_dir,
                 read_temperature=False, read_moisture=False,
-                read_scalars=False, n_scalars=0, has_ghost=True,
-                timestep_range=timestep_range
+                read_scalars=False, timestep_range=timestep_range
             )
             
             print("\n" + "="*70)
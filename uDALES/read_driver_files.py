@@ -1,9 +1,289 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import struct
 import os
+import re
+import json
 from pathlib import Path
 #
+# Lazy view of the processor files of one field collated in the y-direction
+#
+class CollatedArray:
+    '''
+        Collated (t, y, z) or (t, y, z, m) field of all processors without concatenating them.
+        It is the same array as concatenating the ghost-trimmed processor blocks along y, but
+        an index only reads the processors that hold the requested y rows, e.g. arr[t0:t1, j0:j1, k]
+        or arr[t] for one plane. Converting it with np.asarray reads the whole field.
+
+    Parameters:
+    -----------
+    parts : list
+        Per-processor arrays (memory maps) of shape (t, y_local, z) or (t, y_local, z, m)
+    jh : int
+        Number of ghost cells in the y-direction
+    -----------
+    Indexing supports integers and slices on every axis and also integer or boolean arrays
+    on the y-axis.
+    '''
+
+    def __init__(self, parts, jh=1):
+        if any(len(data) != len(parts[0]) for data in parts):
+            raise ValueError("All processors must provide the same number of time steps")
+        # First processor: keep all including ghost at end, middle processors: skip ghosts at
+        # both ends, last processor: skip ghost at start
+        self.parts = []
+        for i, data in enumerate(parts):
+            start = jh if i > 0 else 0
+            stop = data.shape[1]-jh if 0 < i < len(parts)-1 else data.shape[1]
+            self.parts.append(data[:, start:stop])
+        # Collated y index of the first row of every processor
+        self.offsets = np.cumsum([0]+[data.shape[1] for data in self.parts])
+        self.shape = (parts[0].shape[0], int(self.offsets[-1]))+parts[0].shape[2:]
+        self.ndim = len(self.shape)
+        self.dtype = parts[0].dtype
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return f"CollatedArray(shape={self.shape}, processors={len(self.parts)})"
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:]
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+    def _expand(self, key):
+        # Full index tuple, one entry per axis
+        if not isinstance(key, tuple):
+            key = (key,)
+        ellipsis = [i for i, k in enumerate(key) if k is Ellipsis]
+        if ellipsis:
+            i = ellipsis[0]
+            key = key[:i]+(slice(None),)*(self.ndim-len(key)+1)+key[i+1:]
+        if len(key) > self.ndim:
+            raise IndexError(f"Too many indices for a {self.ndim}-dimensional array")
+        return key+(slice(None),)*(self.ndim-len(key))
+
+    def __getitem__(self, key):
+        key = self._expand(key)
+        tkey, jkey, rest = key[0], key[1], key[2:]
+        if not all(isinstance(k, (int, np.integer, slice)) for k in (tkey,)+rest):
+            raise IndexError("Only integers and slices are supported on the time, z and scalar axes")
+        jindex = np.arange(self.shape[1])[jkey]
+        if jindex.ndim > 1:
+            raise IndexError("The y index must be an integer, a slice or a 1D array")
+        # Processor and local row of every requested y row
+        proc = np.searchsorted(self.offsets, jindex, side='right')-1
+        local = jindex-self.offsets[proc]
+        if jindex.ndim == 0:
+            return np.array(self.parts[proc][(tkey, local)+rest])
+        if len(jindex) == 0:
+            return np.array(self.parts[0][(tkey, slice(0, 0))+rest])
+        # Position of the y-axis in the result
+        jaxis = 0 if isinstance(tkey, (int, np.integer)) else 1
+        out = None
+        # Every run of consecutive rows from one processor is a single strided read
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(proc))+1, [len(jindex)]))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            data, rows = self.parts[proc[a]], local[a:b]
+            step = rows[1]-rows[0] if len(rows) > 1 else 1
+            if step != 0 and np.all(np.diff(rows) == step):
+                stop = rows[-1]+np.sign(step)
+                piece = data[(tkey, slice(rows[0], stop if stop >= 0 else None, step))+rest]
+            else:
+                # Irregular rows: read the covering block and pick the rows from it
+                lo = rows.min()
+                piece = np.take(data[(tkey, slice(lo, rows.max()+1))+rest], rows-lo, axis=jaxis)
+            if out is None:
+                shape = list(piece.shape)
+                shape[jaxis] = len(jindex)
+                out = np.empty(shape, dtype=self.dtype)
+            out[(slice(None),)*jaxis+(slice(a, b),)] = piece
+        return out
+#
+# Driver file layout discovery
+#
+def read_namoptions(filename):
+    '''
+        Read the entries of a namoptions file into a flat dictionary (lower-case names,
+        the namelist groups are not kept). Integers, floats, logicals and strings are converted.
+    '''
+    options = {}
+    with open(filename, 'r') as f:
+        text = f.read()
+    text = re.sub(r'!.*', '', text)
+    for name, value in re.findall(r'(\w+)\s*=\s*(\'[^\']*\'|"[^"]*"|[^,\s/]+)', text):
+        if re.fullmatch(r'[+-]?\d+', value):
+            value = int(value)
+        elif re.fullmatch(r'\.?(true|false|t|f)\.?', value, re.IGNORECASE):
+            value = value.strip('.').lower() in ('true', 't')
+        else:
+            try:
+                value = float(value.replace('d', 'e').replace('D', 'e'))
+            except ValueError:
+                value = value.strip('\'"')
+        options[name.lower()] = value
+    return options
+
+def _file_signature(paths):
+    # Size and modification time of every file, a changed file invalidates the cached layout
+    return {str(path.name): [path.stat().st_size, path.stat().st_mtime_ns] for path in paths if path.exists()}
+
+def discover_driver_layout(experiment_number, directory='.', nprocy=None, ny=None, nz=None, nsv=None,
+                           job_number=None, use_cache=True):
+    '''
+        Work out the layout of the driver files of one experiment and check every processor file.
+        nprocy, ny (jtot), nz (ktot) and nsv are read from namoptions.XXX (or namoptions), nz also from
+        the number of levels in lscale.inp.XXX, and the number of time steps from tdriver_000.YYY.
+        Values that are passed are checked against these files. The ghost cells and, when it is not
+        known, nsv are solved from the exact size of the driver files. The layout is cached in
+        driver_layout.XXX.json and reused as long as none of the files changed.
+
+    Parameters:
+    -----------
+    experiment_number : str or int
+        3-digit experiment number of the driver files
+    directory : str
+        Directory with the driver, namoptions and lscale.inp files
+    job_number : str or int, optional
+        Job number of the time file (if different from experiment_number)
+    -----------
+    Returns a dictionary with nprocy, ny, nz, ny_local, has_ghost, jh, kh, nsv, n_timesteps,
+    n_complete (time steps complete in all files) and per field the record size and number of
+    complete records of every processor file. Truncated files are reported as warnings.
+    '''
+    directory = Path(directory)
+    exp_nr = f"{int(experiment_number):03d}"
+    job_nr = f"{int(job_number):03d}" if job_number else exp_nr
+    cache_file = directory / f"driver_layout.{exp_nr}.json"
+    namoptions = next((path for path in (directory / f"namoptions.{exp_nr}", directory / "namoptions")
+                       if path.exists()), None)
+    lscale = directory / f"lscale.inp.{exp_nr}"
+    time_file = directory / f"tdriver_000.{job_nr}"
+    if not time_file.exists():
+        raise FileNotFoundError(f"Time file not found: {time_file}")
+    requested = {'nprocy': nprocy, 'ny': ny, 'nz': nz, 'nsv': nsv}
+
+    # Reuse the cached layout when all files are unchanged (only stat calls)
+    if use_cache and cache_file.exists():
+        with open(cache_file, 'r') as f:
+            cached = json.load(f)
+        layout = cached['layout']
+        paths = [directory / name for name in cached['signature']]
+        if (cached['requested'] == requested and all(path.exists() for path in paths)
+                and _file_signature(paths) == cached['signature']
+                and len(list(directory.glob(f"?driver_*.{exp_nr}"))) == cached['n_driver_files']):
+            _report_layout(layout)
+            return layout
+
+    # Grid and decomposition from namoptions and lscale.inp
+    options = read_namoptions(namoptions) if namoptions else {}
+    known = {'nprocy': options.get('nprocy'), 'ny': options.get('jtot'), 'nz': options.get('ktot'),
+             'nsv': options.get('nsv')}
+    if lscale.exists():
+        nz_lscale = np.loadtxt(lscale, skiprows=1, ndmin=2).shape[0]
+        if known['nz'] is not None and known['nz'] != nz_lscale:
+            raise ValueError(f"ktot={known['nz']} in {namoptions.name} but {lscale.name} has {nz_lscale} levels")
+        known['nz'] = nz_lscale
+    for name, value in requested.items():
+        if value is None:
+            continue
+        if known[name] is not None and known[name] != value:
+            raise ValueError(f"{name}={value} does not match {name}={known[name]} from namoptions/lscale.inp")
+        known[name] = value
+    if known['nprocy'] is None:
+        known['nprocy'] = len(list(directory.glob(f"udriver_*.{exp_nr}")))
+    for name in ('ny', 'nz'):
+        if known[name] is None:
+            raise ValueError(f"Cannot determine {name}: no namoptions/lscale.inp in {directory} and no value given")
+    nprocy, ny, nz = known['nprocy'], known['ny'], known['nz']
+    if nprocy < 1 or ny % nprocy != 0:
+        raise ValueError(f"ny={ny} is not divisible by nprocy={nprocy}")
+    ny_local = ny // nprocy
+
+    # Number of time steps
+    time_size = time_file.stat().st_size
+    n_timesteps = time_size // 8
+    if time_size % 8:
+        print(f"  WARNING: {time_file.name} ends with an incomplete time stamp")
+
+    # Driver files of every field and processor
+    fields = {}
+    for field_name in ('u', 'v', 'w', 'h', 'q', 's'):
+        paths = [directory / f"{field_name}driver_{proc_id:03d}.{exp_nr}" for proc_id in range(nprocy)]
+        if not paths[0].exists():
+            continue
+        missing = [path.name for path in paths if not path.exists()]
+        if missing:
+            raise FileNotFoundError(f"Missing driver files: {', '.join(missing)}")
+        fields[field_name] = [path.stat().st_size for path in paths]
+    if not fields:
+        raise FileNotFoundError(f"No driver files of experiment {exp_nr} in {directory}")
+
+    # Ghost cells: the layout for which the files hold exactly n_timesteps records
+    def cells(has_ghost):
+        return (ny_local + 2*int(has_ghost)) * (nz + 2*int(has_ghost))
+    velocity = [size for name, sizes in fields.items() if name != 's' for size in sizes]
+    # A complete file pins the layout, otherwise (truncated run) every file must hold whole records
+    candidates = [g for g in (True, False) if cells(g)*8*n_timesteps in velocity]
+    if not candidates:
+        candidates = [g for g in (True, False)
+                      if all(size % (cells(g)*8) == 0 and size <= cells(g)*8*n_timesteps for size in velocity)]
+    if len(candidates) != 1:
+        raise ValueError(f"The driver file sizes do not determine the ghost cells for ny={ny}, nz={nz}, "
+                         f"nprocy={nprocy} and {n_timesteps} time steps (candidates: {candidates})")
+    has_ghost = candidates[0]
+
+    # Number of scalars from the scalar files
+    nsv = known['nsv']
+    if 's' in fields:
+        sizes = fields['s']
+        per_record = cells(has_ghost) * 8 * n_timesteps
+        if nsv is None or nsv == 0:
+            full = [size // per_record for size in sizes if size % per_record == 0 and size > 0]
+            if not full:
+                raise ValueError("Cannot determine nsv from truncated scalar driver files, pass nsv")
+            nsv = max(full)
+    nsv = int(nsv or 0)
+
+    # Check every processor file
+    layout = {'experiment': exp_nr, 'job': job_nr, 'nprocy': nprocy, 'ny': ny, 'nz': nz,
+              'ny_local': ny_local, 'has_ghost': has_ghost, 'jh': int(has_ghost), 'kh': int(has_ghost),
+              'nsv': nsv, 'n_timesteps': n_timesteps, 'fields': {}}
+    for field_name, sizes in fields.items():
+        record_size = cells(has_ghost) * 8 * (nsv if field_name == 's' else 1)
+        if record_size == 0:
+            continue
+        layout['fields'][field_name] = {'record_size': record_size,
+                                        'n_records': [size // record_size for size in sizes],
+                                        'partial_bytes': [size % record_size for size in sizes]}
+    layout['n_complete'] = min(min(min(info['n_records']), n_timesteps) for info in layout['fields'].values())
+    _report_layout(layout)
+
+    if use_cache:
+        paths = [path for path in (namoptions, lscale, time_file) if path is not None]
+        paths += [directory / f"{name}driver_{proc_id:03d}.{exp_nr}" for name in fields for proc_id in range(nprocy)]
+        cached = {'requested': requested, 'signature': _file_signature(paths),
+                  'n_driver_files': len(list(directory.glob(f"?driver_*.{exp_nr}"))), 'layout': layout}
+        with open(cache_file, 'w') as f:
+            json.dump(cached, f, indent=1)
+    return layout
+
+def _report_layout(layout):
+    # Flag truncated or inconsistent driver files
+    for field_name, info in layout['fields'].items():
+        for proc_id, (n_records, partial) in enumerate(zip(info['n_records'], info['partial_bytes'])):
+            filename = f"{field_name}driver_{proc_id:03d}.{layout['experiment']}"
+            if n_records < layout['n_timesteps']:
+                print(f"  WARNING: {filename} is truncated, {n_records} of {layout['n_timesteps']} time steps")
+            elif n_records > layout['n_timesteps']:
+                print(f"  WARNING: {filename} has {n_records} records but tdriver only {layout['n_timesteps']} time stamps")
+            if partial:
+                print(f"  WARNING: {filename} ends with an incomplete record ({partial} bytes)")
+#
 # Define the DriverFileReader class that setups the reader for uDALES driver files
 #
 class DriverFileReader:
@@ -18,16 +298,20 @@ class DriverFileReader:
     read_time_file(directory='.')
         Read the time stamp file (tdriver_000.YYY)
     read_field_file_single(field_name, driver_id, ny_local, nz, n_timesteps,
-                            directory='.', scalar_fields=1, has_ghost=True)
+                            directory='.', scalar_fields=None, has_ghost=None)
           Read a single field file from one processor               
     read_field_file(field_name, ny_total, nz, n_timesteps, directory='.',
-                    scalar_fields=1, has_ghost=True)
-          Read and collate field files from all processors in y-direction
-    read_all_fields(ny, nz, directory='.',
+                    scalar_fields=None, has_ghost=None, print_range=False)
+          Collate the field files of all processors in y-direction (lazy CollatedArray)
+    discover_layout(directory='.', ny=None, nz=None, nsv=None, use_cache=True)
+          Discover and check the layout of the driver files from namoptions, lscale.inp and tdriver
+    read_all_fields(ny=None, nz=None, directory='.',
                     read_temperature=False, read_moisture=False,
-                    read_scalars=False, n_scalars=0, has_ghost=True)
+                    read_scalars=False, n_scalars=None, has_ghost=None)
           Read all available driver fields and collate across processors
     -----------
+    scalar_fields, n_scalars and has_ghost default to the layout found by discover_layout()
+    (one scalar field and ghost cells without it)
     '''
     
     def __init__(self, experiment_number, nprocy=1, job_number=None):
@@ -46,6 +330,21 @@ class DriverFileReader:
         self.exp_nr = f"{int(experiment_number):03d}"
         self.nprocy = nprocy
         self.job_nr = f"{int(job_number):03d}" if job_number else self.exp_nr
+        self.layout = None
+        
+    def _from_layout(self, ny_local, nz, scalar_fields, has_ghost):
+        '''
+            Discovered layout when it describes this grid, with its number of scalars and ghost
+            cells as defaults for scalar_fields and has_ghost
+        '''
+        layout = self.layout
+        if layout is None or (layout['ny_local'], layout['nz']) != (ny_local, nz):
+            layout = None
+        if scalar_fields is None:
+            scalar_fields = (layout['nsv'] or 1) if layout else 1
+        if has_ghost is None:
+            has_ghost = layout['has_ghost'] if layout else True
+        return layout, scalar_fields, has_ghost
         
     def read_time_file(self, directory='.'):
         '''
@@ -68,18 +367,13 @@ class DriverFileReader:
         
         print(f"Reading {n_records} time stamps from {filename}")
         
-        times = np.zeros(n_records)
-        
-        with open(filepath, 'rb') as f:
-            for i in range(n_records):
-                data = f.read(record_size)
-                if len(data) == record_size:
-                    times[i] = struct.unpack('d', data)[0]
+        # All time stamps in one read (a trailing incomplete record is ignored)
+        times = np.fromfile(filepath, dtype=np.float64, count=n_records)
         
         return times
     
     def read_field_file_single(self, field_name, driver_id, ny_local, nz, n_timesteps, 
-                               directory='.', scalar_fields=1, has_ghost=True):
+                               directory='.', scalar_fields=None, has_ghost=None):
         '''
             Read a single field file from one processor
         
@@ -97,6 +391,7 @@ class DriverFileReader:
             raise FileNotFoundError(f"Field file not found: {filepath}")
         
         # Ghost cell configuration
+        _, scalar_fields, has_ghost = self._from_layout(ny_local, nz, scalar_fields, has_ghost)
         jh = 1 if has_ghost else 0
         kh = 1 if has_ghost else 0
         ny_local_total = ny_local + 2 * jh
@@ -108,54 +403,38 @@ class DriverFileReader:
         else:
             record_size = ny_local_total * nz_total * 8
         
-        # Check file size
+        # Check file size, a file larger than n_timesteps records does not have this layout
         file_size = filepath.stat().st_size
         expected_size = record_size * n_timesteps
         
-        if abs(file_size - expected_size) > 100:
-            # Try to auto-detect dimensions
-            actual_vals_per_step = file_size // (n_timesteps * 8)
-            if field_name == 's':
-                actual_vals_per_step = actual_vals_per_step // scalar_fields
-            
-            # Factor to find actual dimensions
-            for test_nz in range(max(1, nz-50), nz+50):
-                if actual_vals_per_step % test_nz == 0:
-                    test_ny = actual_vals_per_step // test_nz
-                    ny_local_total = test_ny
-                    nz_total = test_nz
-                    record_size = ny_local_total * nz_total * 8
-                    if field_name == 's':
-                        record_size *= scalar_fields
-                    break
-        
-        # Allocate array for this processor's data
+        if file_size > expected_size:
+            raise ValueError(f"{filename} has {file_size} bytes, more than {n_timesteps} records of "
+                             f"{ny_local_total}x{nz_total}" + (f"x{scalar_fields}" if field_name == 's' else '')
+                             + " values; check ny, nz and has_ghost or use discover_driver_layout()")
+        
+        # Only complete records are mapped
+        n_available = min(n_timesteps, file_size // record_size)
+        if n_available < n_timesteps:
+            print(f"  WARNING: Incomplete record at timestep {n_available} in {filename}")
+        
+        # Memory-map the file, nothing is read until the caller slices. Every record is stored in
+        # Fortran order (j varies fastest, then k, then m for 's'), i.e. a C-ordered (k, j) or
+        # (m, k, j) block, which is exposed as a (t, j, k) or (t, j, k, m) strided view.
         if field_name == 's':
-            field_data = np.zeros((n_timesteps, ny_local_total, nz_total, scalar_fields))
+            shape = (n_available, scalar_fields, nz_total, ny_local_total)
+            axes = (0, 3, 2, 1)
         else:
-            field_data = np.zeros((n_timesteps, ny_local_total, nz_total))
-        
-        # Read data
-        with open(filepath, 'rb') as f:
-            for t in range(n_timesteps):
-                data = f.read(record_size)
-                if len(data) < record_size:
-                    print(f"  WARNING: Incomplete record at timestep {t} in {filename}")
-                    break
-                
-                values = np.frombuffer(data, dtype=np.float64)
-                
-                if field_name == 's':
-                    # Fortran order: j varies fastest, then k, then m (Based on moddriver.f90 code -- check for correctness - Akshay Nov 19th 2025)
-                    field_data[t] = values.reshape((ny_local_total, nz_total, scalar_fields), order='F')
-                else:
-                    # Fortran order: j varies fastest, then k
-                    field_data[t] = values.reshape((ny_local_total, nz_total), order='F')
+            shape = (n_available, nz_total, ny_local_total)
+            axes = (0, 2, 1)
+        if n_available == 0:
+            field_data = np.empty(shape).transpose(axes)
+        else:
+            field_data = np.memmap(filepath, dtype=np.float64, mode='r', shape=shape).transpose(axes)
         
         return field_data, ny_local_total, nz_total
     
     def read_field_file(self, field_name, ny_total, nz, n_timesteps, directory='.', 
-                       scalar_fields=1, has_ghost=True):
+                       scalar_fields=None, has_ghost=None, print_range=False):
         '''
             Read and collate field files from all processors in y-direction
         
@@ -165,11 +444,16 @@ class DriverFileReader:
             Total number of y grid points across all processors (without ghost cells)
         nz : int
             Number of z grid points (without ghost cells)
+        print_range : bool
+            Print the minimum and maximum value (reads the whole field)
+        -----------
+        With a discovered layout the field is cut to the time steps that all fields and tdriver have
         '''
         print(f"\nReading field '{field_name}' from {self.nprocy} processor(s)")
         
         # Calculate local ny for each processor
         ny_local = ny_total // self.nprocy
+        layout, scalar_fields, has_ghost = self._from_layout(ny_local, nz, scalar_fields, has_ghost)
         
         print(f"  Total grid: ny={ny_total}, nz={nz}")
         print(f"  Per processor: ny_local={ny_local}")
@@ -191,49 +475,42 @@ class DriverFileReader:
         
         
         jh = 1 if has_ghost else 0
+        
+        # Truncated files only provide their complete records, keep the time steps all processors have
+        n_common = min(len(data) for data in proc_data)
+        if any(len(data) != n_common for data in proc_data):
+            print(f"  WARNING: Using the first {n_common} time steps that all processors wrote")
+        if layout:
+            n_common = min(n_common, layout['n_complete'])
+        proc_data = [data[:n_common] for data in proc_data]
                 
         print(f"  Collating data along y-axis...")
         
         if len(proc_data) == 1:            
             collated_data = proc_data[0]
-        else:            
-            if field_name == 's':                
-                collated_parts = []
-                for i, data in enumerate(proc_data):
-                    if i == 0:
-                        # First processor: keep all including ghost at end
-                        collated_parts.append(data[:, :, :, :])
-                    elif i == len(proc_data) - 1:
-                        # Last processor: skip ghost at start
-                        collated_parts.append(data[:, jh:, :, :])
-                    else:
-                        # Middle processors: skip ghosts at both ends
-                        collated_parts.append(data[:, jh:-jh, :, :])
-                
-                collated_data = np.concatenate(collated_parts, axis=1)
-            else:                
-                collated_parts = []
-                for i, data in enumerate(proc_data):
-                    if i == 0:
-                        # First processor: keep all including ghost at end
-                        collated_parts.append(data[:, :, :])
-                    elif i == len(proc_data) - 1:
-                        # Last processor: skip ghost at start
-                        collated_parts.append(data[:, jh:, :])
-                    else:
-                        # Middle processors: skip ghosts at both ends
-                        collated_parts.append(data[:, jh:-jh, :])
-                
-                collated_data = np.concatenate(collated_parts, axis=1)
+        else:
+            # Lazy collated view, only the processors touched by an index are read
+            collated_data = CollatedArray(proc_data, jh)
         
         print(f"  Final collated shape: {collated_data.shape}")
-        print(f"  Value range: [{collated_data.min():.6f}, {collated_data.max():.6f}]")
+        if print_range:
+            values = np.asarray(collated_data)
+            print(f"  Value range: [{values.min():.6f}, {values.max():.6f}]")
         
         return collated_data
     
-    def read_all_fields(self, ny, nz, directory='.', 
+    def discover_layout(self, directory='.', ny=None, nz=None, nsv=None, use_cache=True):
+        '''
+            Discover and check the layout of the driver files (see discover_driver_layout),
+            nprocy of the reader is checked against namoptions
+        '''
+        self.layout = discover_driver_layout(self.exp_nr, directory, self.nprocy, ny, nz, nsv,
+                                             self.job_nr, use_cache)
+        return self.layout
+    
+    def read_all_fields(self, ny=None, nz=None, directory='.', 
                        read_temperature=False, read_moisture=False, 
-                       read_scalars=False, n_scalars=0, has_ghost=True):
+                       read_scalars=False, n_scalars=None, has_ghost=None):
         '''
             Read all available driver fields and collate across processors
         
@@ -243,10 +520,23 @@ class DriverFileReader:
             Total number of grid points in y-direction (without ghost cells)
         nz : int
             Number of grid points in z-direction (without ghost cells)
+        -----------
+        Without ny or nz the layout (ny, nz, ghost cells and number of scalars) is discovered
+        from namoptions, lscale.inp and the driver file sizes. A layout found before by
+        discover_layout() provides the ghost cells, number of scalars and complete time steps
         '''
+        if ny is None or nz is None:
+            layout = self.discover_layout(directory, ny, nz)
+            ny, nz = layout['ny'], layout['nz']
+        layout, _, has_ghost = self._from_layout(ny // self.nprocy, nz, None, has_ghost)
+        if n_scalars is None:
+            n_scalars = layout['nsv'] if layout else 0
+        
         # First read time stamps
         times = self.read_time_file(directory)
         n_timesteps = len(times)
+        if layout:
+            times = times[:layout['n_complete']]
         
         data = {
             'times': times,
@@ -291,6 +581,7 @@ if __name__ == "__main__":
     video_fps = 60                          # FPS for the saved animation
     umax = 18.0                             # Max U velocity for color scale in animation
     calc_rms = False                        # Whether to calculate and plot rms velocity profiles
+    check_layout = True                     # Check ny, nz and all driver files against namoptions/lscale.inp/tdriver
     #
     # Setup the driver file reader
     reader = DriverFileReader(experiment_number=experiment_number, nprocy=nprocy)            
@@ -298,6 +589,8 @@ if __name__ == "__main__":
         print("="*70)
         print(f"Reading uDALES driver files with nprocy={nprocy}")
         print("="*70)
+        if check_layout:
+            reader.discover_layout(data_dir, ny, nz)
 
         data = reader.read_all_fields(
             ny=ny, 
@@ -305,9 +598,7 @@ if __name__ == "__main__":
             directory=data_dir,
             read_temperature=False,  
             read_moisture=False,     
-            read_scalars=False,      
-            n_scalars=0,
-            has_ghost=True  
+            read_scalars=False
         )
         # Print summary of the driver files read
         print("\n" + "="*70)